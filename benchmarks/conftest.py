@@ -0,0 +1,191 @@
+import os
+import stat
+import sys
+
+import pytest
+from flask import Flask
+
+from flask_rollup import Bundle, Rollup
+
+FAKE_ROLLUP = """#!{python}
+# Stand-in for Rollup executable: concatenates entrypoints with all modules they
+# import into content hashed output files and writes build metadata like
+# flask-rollup-meta plugin does.
+import hashlib, json, os, re, sys
+
+IMPORT_RE = re.compile(r"^import '(.+)';$", re.MULTILINE)
+
+
+def modules(path, seen):
+    if path in seen:
+        return
+    seen.append(path)
+    with open(path) as fp:
+        content = fp.read()
+    for name in IMPORT_RE.findall(content):
+        modules(os.path.normpath(os.path.join(os.path.dirname(path), name)), seen)
+
+
+args = sys.argv[1:]
+target_dir = args[args.index('-d') + 1]
+inputs = [arg.split('=', 1) for arg in args if '=' in arg]
+entries = {{}}
+chunks = {{}}
+os.makedirs(target_dir, exist_ok=True)
+for name, path in inputs:
+    seen = []
+    modules(path, seen)
+    content = ''.join(open(module).read() for module in seen)
+    digest = hashlib.sha256(content.encode('utf-8')).hexdigest()[:8]
+    file_name = f'{{name}}.{{digest}}.js'
+    with open(os.path.join(target_dir, file_name), 'w') as fp:
+        fp.write(content)
+    with open(os.path.join(target_dir, f'{{file_name}}.map'), 'w') as fp:
+        fp.write('{{}}')
+    entries[name] = seen
+    chunks[file_name] = {{
+        'name': name, 'isEntry': True, 'imports': [], 'dynamicImports': [],
+    }}
+meta_path = os.environ.get('FLASK_ROLLUP_META')
+if meta_path:
+    with open(meta_path, 'w') as fp:
+        json.dump({{'entries': entries, 'chunks': chunks}}, fp)
+"""
+
+MODULE = """import '../shared/lib{shared}.js';
+export const value{index} = '{payload}';
+"""
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('flask-rollup benchmarks')
+    group.addoption(
+        '--bundles', type=int, default=100,
+        help='number of bundles in synthetic project',
+    )
+    group.addoption(
+        '--modules', type=int, default=20,
+        help='number of local modules imported by every bundle',
+    )
+    group.addoption(
+        '--module-size', type=int, default=2048,
+        help='size of every synthetic module in bytes',
+    )
+
+
+@pytest.fixture(scope='session')
+def fake_rollup(tmp_path_factory):
+    path = tmp_path_factory.mktemp('bin') / 'rollup'
+    path.write_text(FAKE_ROLLUP.format(python=sys.executable))
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    return str(path)
+
+
+def generate_project(root, bundles, modules, module_size):
+    """Generate synthetic Javascript project in directory ``root``. Every bundle
+    has single entrypoint that imports ``modules`` bundle specific modules, and
+    each of these imports one of shared library modules.
+
+    Returns:
+        list of tuples with bundle name, entrypoint and dependencies, relative to
+        root
+    """
+    shared_dir = os.path.join(root, 'src', 'shared')
+    os.makedirs(shared_dir, exist_ok=True)
+    shared = max(modules // 4, 1)
+    for index in range(shared):
+        with open(os.path.join(shared_dir, f'lib{index}.js'), 'w') as fp:
+            fp.write(f"export const lib{index} = '{'x' * module_size}';\n")
+    rv = []
+    for bundle_index in range(bundles):
+        name = f'page{bundle_index}'
+        bundle_dir = os.path.join(root, 'src', name)
+        os.makedirs(bundle_dir, exist_ok=True)
+        dependencies = []
+        for index in range(modules):
+            module_name = f'mod{index}.js'
+            with open(os.path.join(bundle_dir, module_name), 'w') as fp:
+                fp.write(MODULE.format(
+                    shared=index % shared, index=index, payload='x' * module_size,
+                ))
+            dependencies.append(f'src/{name}/{module_name}')
+        with open(os.path.join(bundle_dir, 'main.js'), 'w') as fp:
+            for module_name in dependencies:
+                fp.write(f"import './{os.path.basename(module_name)}';\n")
+        rv.append((name, f'src/{name}/main.js', dependencies))
+    return rv
+
+
+@pytest.fixture(scope='session')
+def project(request, tmp_path_factory):
+    root = tmp_path_factory.mktemp('static')
+    definitions = generate_project(
+        str(root), request.config.getoption('--bundles'),
+        request.config.getoption('--modules'),
+        request.config.getoption('--module-size'),
+    )
+    return str(root), definitions
+
+
+@pytest.fixture()
+def make_bundles(project):
+    def factory():
+        return [
+            Bundle(name, 'dist', [entrypoint], dependencies=list(dependencies))
+            for name, entrypoint, dependencies in project[1]
+        ]
+    return factory
+
+
+@pytest.fixture()
+def make_app(project, fake_rollup, monkeypatch, tmp_path):
+    def factory(environment='production', **config):
+        monkeypatch.setenv('FLASK_ENV', environment)
+        app = Flask('benchmark', instance_path=str(tmp_path / 'instance'))
+        app.static_folder = project[0]
+        app.config['ROLLUP_PATH'] = fake_rollup
+        app.config['ROLLUP_CONFIG_JS'] = 'rollup.config.js'
+        app.config.update(config)
+        return app
+    return factory
+
+
+@pytest.fixture()
+def make_rollup():
+    def factory(app, bundles, view_func=None):
+        """Register bundles with new extension object, with view served at
+        ``/<bundle name>`` for each bundle if ``view_func`` is provided.
+        """
+        rollup = Rollup(app)
+        for bundle in bundles:
+            rollup.register(bundle)
+            if view_func is not None:
+                app.add_url_rule(
+                    f'/{bundle.name}', endpoint=bundle.name, view_func=view_func
+                )
+        return rollup
+    return factory
+
+
+@pytest.fixture(scope='session')
+def built_project(project, fake_rollup, tmp_path_factory):
+    """Build all bundles of synthetic project once per session and write build
+    manifest, so benchmarks of production code paths have artifacts to work with.
+    """
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('FLASK_ENV', 'production')
+        app = Flask(
+            'benchmark', instance_path=str(tmp_path_factory.mktemp('instance'))
+        )
+        app.static_folder = project[0]
+        app.config['ROLLUP_PATH'] = fake_rollup
+        app.config['ROLLUP_CONFIG_JS'] = 'rollup.config.js'
+        rollup = Rollup(app)
+        for name, entrypoint, dependencies in project[1]:
+            rollup.register(
+                Bundle(name, 'dist', [entrypoint], dependencies=list(dependencies))
+            )
+        results = rollup.run_batch()
+        assert all(result.success for result in results)
+        rollup.write_manifest()
+    return project
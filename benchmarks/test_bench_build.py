@@ -0,0 +1,31 @@
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+
+@pytest.mark.parametrize('jobs', [1, 0])
+def test_build_all(
+    benchmark, built_project, make_app, make_bundles, make_rollup, jobs
+):
+    rollup = make_rollup(make_app(ROLLUP_STATE_CACHE=False), make_bundles())
+    results = benchmark.pedantic(
+        rollup.run_all, kwargs={'jobs': jobs, 'force': True}, rounds=3,
+    )
+    assert all(result.success for result in results)
+
+
+def test_build_batch(
+    benchmark, built_project, make_app, make_bundles, make_rollup
+):
+    rollup = make_rollup(make_app(ROLLUP_STATE_CACHE=False), make_bundles())
+    results = benchmark.pedantic(rollup.run_batch, rounds=3)
+    assert all(result.success for result in results)
+
+
+def test_staleness_check_all(
+    benchmark, built_project, make_app, make_bundles, make_rollup
+):
+    rollup = make_rollup(make_app(), make_bundles())
+    rollup.run_all()
+    results = benchmark(rollup.run_all)
+    assert all(result.success for result in results)
@@ -0,0 +1,64 @@
+import pytest
+from flask import render_template_string
+
+import flask_rollup
+
+pytest.importorskip('pytest_benchmark')
+
+
+def view():
+    return render_template_string('{{ jsbundle_tag(request.endpoint) }}')
+
+
+@pytest.mark.parametrize('environment', ['production', 'development'])
+def test_request(
+    benchmark, built_project, make_app, make_bundles, make_rollup, environment
+):
+    app = make_app(environment)
+    make_rollup(app, make_bundles(), view)
+    client = app.test_client()
+    assert client.get('/page0').status_code == 200
+    rv = benchmark(client.get, '/page0')
+    assert rv.status_code == 200
+
+
+def test_request_check_interval(
+    benchmark, built_project, make_app, make_bundles, make_rollup
+):
+    app = make_app('development', ROLLUP_CHECK_INTERVAL=60)
+    make_rollup(app, make_bundles(), view)
+    client = app.test_client()
+    assert client.get('/page0').status_code == 200
+    rv = benchmark(client.get, '/page0')
+    assert rv.status_code == 200
+
+
+def test_render(benchmark, built_project, make_app, make_bundles, make_rollup):
+    app = make_app()
+    make_rollup(app, make_bundles(), view)
+    with app.test_request_context('/page0'):
+        rv = benchmark(render_template_string, '{{ jsbundle("page0") }}')
+    assert rv.endswith('.js')
+
+
+def test_calc_state(benchmark, built_project, make_bundles):
+    bundle = make_bundles()[0]
+    bundle.resolve_paths(built_project[0])
+    state = bundle.calc_state()
+    assert benchmark(bundle.calc_state) == state
+
+
+def test_calc_state_cold(benchmark, built_project, make_bundles):
+    bundle = make_bundles()[0]
+    bundle.resolve_paths(built_project[0])
+
+    def setup():
+        flask_rollup._fingerprints.clear()
+    benchmark.pedantic(bundle.calc_state, setup=setup, rounds=50)
+
+
+def test_resolve_output(benchmark, built_project, make_bundles):
+    bundle = make_bundles()[0]
+    bundle.resolve_paths(built_project[0])
+    benchmark(bundle.resolve_output, built_project[0], '/static', 'sha384')
+    assert bundle.output is not None
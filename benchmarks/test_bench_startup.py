@@ -0,0 +1,28 @@
+import pytest
+
+from flask_rollup import Rollup
+
+pytest.importorskip('pytest_benchmark')
+
+
+def register_all(app, bundles):
+    rollup = Rollup(app)
+    for bundle in bundles:
+        rollup.register(bundle)
+    return rollup
+
+
+@pytest.mark.parametrize('config', [
+    {}, {'ROLLUP_MANIFEST': ''}, {'ROLLUP_LAZY': True},
+], ids=['manifest', 'glob', 'lazy'])
+def test_register(benchmark, built_project, make_app, make_bundles, config):
+    def setup():
+        return (make_app(**config), make_bundles()), {}
+    rollup = benchmark.pedantic(register_all, setup=setup, rounds=20)
+    assert len(rollup.bundles) == len(built_project[1])
+
+
+def test_warm(benchmark, built_project, make_app, make_bundles):
+    def setup():
+        return (register_all(make_app(ROLLUP_LAZY=True), make_bundles()),), {}
+    benchmark.pedantic(Rollup.warm, setup=setup, rounds=20)
@@ -24,6 +24,13 @@ test_reqs = [
     'pytest',
     'pytest-cov',
     'pytest-mock',
+    'blinker',
+]
+
+
+benchmark_reqs = [
+    'pytest',
+    'pytest-benchmark',
 ]
 
 
@@ -66,7 +73,11 @@ setup(
         'Flask>=1.1,<2.3'
     ],
     extras_require={
+        'watchdog': ['watchdog'],
+        'brotli': ['brotli'],
+        'signals': ['blinker'],
         'test': test_reqs,
+        'benchmark': benchmark_reqs,
         'docs': docs_reqs,
         'dev': dev_reqs,
     },
@@ -1,15 +1,73 @@
+import asyncio
+import atexit
+import base64
+import errno
+import functools
 import glob
+import gzip
 import hashlib
+import json
+import logging
+import mimetypes
 import os
+import re
+import shutil
 import subprocess
-from collections import namedtuple
+import tempfile
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
 from dataclasses import dataclass, field
-from typing import List, Mapping, Optional, Union
+from typing import (
+    IO, Any, Callable, Deque, Dict, Iterable, List, Mapping, Optional, Set, Tuple,
+    Union,
+)
 
-from flask import Flask, request
+from flask import Flask, Response, abort, current_app, jsonify, request
+from flask.signals import Namespace
+from markupsafe import Markup, escape
+from werkzeug.wsgi import wrap_file
+
+from .cache import BuildCache, LocalBuildCache
+
+try:
+    from watchdog.observers import Observer
+except ImportError:  # pragma: no cover
+    Observer = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
 
 __version__ = '0.3.1'
 
+logger = logging.getLogger('flask_rollup')
+
+
+def _read_umask() -> int:
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+#: Permissions of files written through temporary files, ``tempfile.mkstemp``
+#: creates them readable only by owner. Umask is read once at import time, as
+#: changing it is not thread safe.
+FILE_MODE = 0o666 & ~_read_umask()
+
 
 def resolve_path(*parts) -> str:  # pragma: no cover
     """Join path parts and normalise resulting path.
@@ -20,7 +78,487 @@ def resolve_path(*parts) -> str:  # pragma: no cover
     return os.path.normpath(os.path.abspath(os.path.join(*parts)))
 
 
-BundleOutput = namedtuple('BundleOutput', ['file_path', 'static_path', 'url'])
+_fingerprints: Dict[str, Tuple[int, int, str]] = {}
+
+
+def file_fingerprint(path: str) -> str:
+    """Calculate checksum of file content. Checksums are cached in memory along
+    with file modification time and size, and file content is read again only if
+    any of these changed.
+
+    Args:
+        path: file path
+
+    Returns:
+        str: file content checksum
+    """
+    st = os.stat(path)
+    cached = _fingerprints.get(path)
+    if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(65536), b''):
+            digest.update(chunk)
+    rv = digest.hexdigest()
+    _fingerprints[path] = (st.st_mtime_ns, st.st_size, rv)
+    return rv
+
+
+SRI_ALGORITHMS = ('sha256', 'sha384', 'sha512')
+
+_integrities: Dict[Tuple[str, str], Tuple[int, int, str]] = {}
+
+
+def file_integrity(path: str, algorithm: str = 'sha384') -> str:
+    """Calculate Subresource Integrity value of file. File is read in chunks so
+    large bundles are never loaded into memory as a whole. Like checksums,
+    integrity values are cached in memory along with file modification time and
+    size.
+
+    Args:
+        path: file path
+        algorithm: hash algorithm, one of ``sha256``, ``sha384`` or ``sha512``
+
+    Returns:
+        str: integrity value
+    """
+    st = os.stat(path)
+    cached = _integrities.get((path, algorithm))
+    if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2]
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(65536), b''):
+            digest.update(chunk)
+    rv = f'{algorithm}-{base64.b64encode(digest.digest()).decode("ascii")}'
+    _integrities[(path, algorithm)] = (st.st_mtime_ns, st.st_size, rv)
+    return rv
+
+
+COMPRESSED_SUFFIXES = {'gzip': '.gz', 'br': '.br'}
+
+
+def precompress(path: str, encodings: Iterable[str]) -> List[str]:
+    """Write compressed variants of file next to it, eg. ``bundle.js.gz`` for
+    ``bundle.js``. Bundle artifacts have content hash in name so existing variant
+    is never outdated and it's not written again. Brotli variant is only written
+    if ``brotli`` package is installed.
+
+    Args:
+        path: file path
+        encodings: content encodings, ``gzip`` or ``br``
+
+    Returns:
+        List[str]: paths of written files
+    """
+    rv = []
+    data = None
+    for encoding in encodings:
+        if encoding == 'br' and brotli is None:
+            continue
+        target = f'{path}{COMPRESSED_SUFFIXES[encoding]}'
+        if os.path.isfile(target) and os.stat(target).st_size > 0:
+            continue
+        if data is None:
+            with open(path, 'rb') as fp:
+                data = fp.read()
+        if encoding == 'gzip':
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        else:
+            compressed = brotli.compress(data, mode=brotli.MODE_TEXT)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        os.fchmod(fd, FILE_MODE)
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(compressed)
+        os.replace(tmp_path, target)
+        rv.append(target)
+    return rv
+
+
+def gzip_size(path: str) -> int:
+    """Return size of file content compressed with gzip. If precompressed variant
+    of file exists, its size is used, otherwise the content is compressed in
+    memory with the same settings.
+
+    Args:
+        path: file path
+
+    Returns:
+        int: compressed size in bytes
+    """
+    target = f'{path}{COMPRESSED_SUFFIXES["gzip"]}'
+    if os.path.isfile(target) and os.stat(target).st_size > 0:
+        return os.stat(target).st_size
+    with open(path, 'rb') as fp:
+        return len(gzip.compress(fp.read(), compresslevel=9, mtime=0))
+
+
+def read_json(path: str) -> Any:
+    """Load data from JSON file.
+
+    Args:
+        path: file path
+
+    Returns:
+        Any: loaded data or ``None`` if file does not exist or is not valid JSON
+    """
+    try:
+        with open(path, encoding='utf-8') as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(path: str, data: Any):
+    """Atomically replace content of JSON file with provided data. The data is
+    written to temporary file in the same directory which is then renamed to
+    target file name, so readers never see partially written content.
+
+    Args:
+        path: file path
+        data: JSON serializable data
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        os.fchmod(fd, FILE_MODE)
+        with os.fdopen(fd, 'w', encoding='utf-8') as fp:
+            json.dump(data, fp)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def replace_file(src: str, dst: str):
+    """Move file replacing destination. If source and destination are on different
+    file systems, the file is copied next to destination first, so it still
+    replaces destination atomically.
+
+    Args:
+        src: source path
+        dst: destination path
+    """
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(dst), prefix='.', suffix='.tmp'
+        )
+        os.close(fd)
+        try:
+            shutil.copyfile(src, tmp_path)
+            shutil.copymode(src, tmp_path)
+            os.replace(tmp_path, dst)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        os.remove(src)
+
+
+def relocate_source_map(path: str, from_dir: str, to_dir: str):
+    """Rewrite relative source paths in source map file, so they remain valid
+    after the map is moved from one directory to another. Maps with source root
+    set, and absolute paths and urls of sources are left intact. Failure to read
+    or parse the map is not an error, the map is left as it is.
+
+    Args:
+        path: source map file path
+        from_dir: directory source paths are relative to
+        to_dir: directory the map will be moved to
+    """
+    data = read_json(path)
+    if not isinstance(data, dict) or data.get('sourceRoot'):
+        return
+    sources = data.get('sources')
+    if not isinstance(sources, list):
+        return
+    relocated = []
+    for source in sources:
+        if isinstance(source, str) and source and not (
+            os.path.isabs(source) or ':' in source
+        ):
+            source = os.path.relpath(
+                os.path.normpath(os.path.join(from_dir, source)), to_dir
+            ).replace(os.sep, '/')
+        relocated.append(source)
+    if relocated != sources:
+        data['sources'] = relocated
+        write_json(path, data)
+
+
+def read_build_meta(path: str) -> Dict[str, Any]:
+    """Load build metadata written by ``flask-rollup-meta`` plugin in Rollup
+    configuration. Metadata contains module graph of every entrypoint and
+    information on every generated chunk.
+
+    Args:
+        path: metadata file path
+
+    Returns:
+        Dict[str, Any]: build metadata, empty if plugin is not installed
+    """
+    data = read_json(path)
+    if not isinstance(data, dict):
+        return {}
+    return data
+
+
+_state_lock = threading.Lock()
+
+
+@contextmanager
+def _file_lock(path: str):
+    """Hold exclusive lock on file, creating it if needed. Where file locking is
+    not supported, nothing is locked.
+    """
+    if fcntl is None:  # pragma: no cover
+        yield
+        return
+    with open(path, 'a') as fp:
+        fcntl.flock(fp.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+
+
+BundleOutput = namedtuple(
+    'BundleOutput', ['file_path', 'static_path', 'url', 'integrity'],
+    defaults=(None,),
+)
+
+BuildResult = namedtuple(
+    'BuildResult', ['name', 'success', 'duration', 'error', 'built'],
+    defaults=(True,),
+)
+
+BundleRef = namedtuple('BundleRef', ['output', 'url', 'tag'])
+
+SizeReport = namedtuple('SizeReport', [
+    'name', 'size', 'gzip_size', 'previous_size', 'previous_gzip_size', 'max_size',
+    'max_gzip_size',
+])
+
+BuildStats = namedtuple('BuildStats', ['duration', 'cpu_time', 'inputs', 'output_size'])
+
+OutputRecord = namedtuple('OutputRecord', ['kind', 'text', 'duration'])
+
+OUTPUT_CHUNK_SIZE = 65536
+
+_ANSI_RE = re.compile(r'\x1b\[[0-9;]*[A-Za-z]')
+_CREATED_RE = re.compile(r'^created .+ in (?P<duration>(?:[\d.]+(?:ms|s|m|h) ?)+)$')
+_DURATION_RE = re.compile(r'(?P<value>[\d.]+)(?P<unit>ms|s|m|h)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+_LOG_LEVELS = {
+    'error': logging.ERROR, 'warning': logging.WARNING, 'created': logging.INFO,
+    'info': logging.DEBUG,
+}
+
+
+def parse_output_line(line: str) -> OutputRecord:
+    """Parse line of Rollup output into structured record. Kind of record is
+    ``error`` for errors (lines starting with ``[!]``), ``warning`` for warnings
+    (lines starting with ``(!)``), ``created`` for lines that report output
+    written with build timing, and ``info`` for everything else. Terminal colour
+    codes are stripped.
+
+    Args:
+        line: line of Rollup output
+
+    Returns:
+        OutputRecord: kind of line, its text and duration in seconds (only for
+        ``created`` lines)
+    """
+    text = _ANSI_RE.sub('', line).rstrip()
+    if text.startswith('[!]'):
+        return OutputRecord('error', text, None)
+    if text.startswith('(!)'):
+        return OutputRecord('warning', text, None)
+    m = _CREATED_RE.match(text)
+    if m:
+        duration = sum(
+            float(part.group('value')) * _DURATION_UNITS[part.group('unit')]
+            for part in _DURATION_RE.finditer(m.group('duration'))
+        )
+        return OutputRecord('created', text, duration)
+    return OutputRecord('info', text, None)
+
+
+def split_output(pending: bytes, chunk: bytes) -> Tuple[List[bytes], bytes]:
+    """Split chunk of process output into complete lines. Output is read in
+    chunks rather than lines, as minified code in error messages easily makes
+    lines huge, so incomplete line longer than ``OUTPUT_CHUNK_SIZE`` is returned
+    in pieces to keep memory use bounded.
+
+    Args:
+        pending: incomplete line left from previous chunk
+        chunk: output chunk, empty at end of output
+
+    Returns:
+        Tuple[List[bytes], bytes]: complete lines and incomplete line
+    """
+    if not chunk:
+        return ([pending] if pending else []), b''
+    *lines, pending = (pending + chunk).split(b'\n')
+    if len(pending) > OUTPUT_CHUNK_SIZE:
+        lines.append(pending)
+        pending = b''
+    return lines, pending
+
+
+class OutputCapture:
+    """Collector of output of single Rollup run. Output is parsed line by line as
+    it arrives, records are logged with ``flask_rollup`` logger and only the last
+    ``max_lines`` records are kept.
+
+    Args:
+        bundle_names: names of bundles built by Rollup run
+        max_lines: number of records to keep
+    """
+
+    def __init__(self, bundle_names: List[str], max_lines: int):
+        self.bundle_names = bundle_names
+        self.records: Deque[OutputRecord] = deque(maxlen=max_lines)
+
+    def feed(self, line: str) -> Optional[OutputRecord]:
+        """Parse and record line of output. Blank lines are ignored.
+
+        Args:
+            line: line of Rollup output
+
+        Returns:
+            Optional[OutputRecord]: parsed record, None for blank lines
+        """
+        if not line.strip():
+            return None
+        record = parse_output_line(line)
+        self.records.append(record)
+        logger.log(
+            _LOG_LEVELS[record.kind], '%s: %s', ', '.join(self.bundle_names),
+            record.text,
+        )
+        return record
+
+    def read(self, fd: int):
+        """Read output from file descriptor until end of file, then close it.
+
+        Args:
+            fd: readable end of pipe
+        """
+        pending = b''
+        with open(fd, 'rb', buffering=0) as fp:
+            while True:
+                chunk = fp.read(OUTPUT_CHUNK_SIZE)
+                lines, pending = split_output(pending, chunk)
+                for line in lines:
+                    self.feed(line.decode('utf-8', 'replace').rstrip('\r'))
+                if not chunk:
+                    break
+
+    def text(self) -> str:
+        """Return text of recorded output.
+
+        Returns:
+            str: recorded lines
+        """
+        return '\n'.join(record.text for record in self.records)
+
+
+ERROR_OVERLAY = """<div id="flask-rollup-overlay" style="position: fixed; inset: 0; \
+z-index: 2147483647; overflow: auto; padding: 2em; background: rgba(0, 0, 0, 0.85); \
+color: #e8e8e8; font: 14px/1.5 monospace;">
+<button onclick="this.parentNode.remove()" style="float: right;">&times;</button>
+<h2 style="color: #ff5555; margin-top: 0;">Failed to build bundle {name}</h2>
+<pre style="white-space: pre-wrap;">{output}</pre>
+</div>"""
+
+_signals = Namespace()
+
+#: Sent when Rollup is started to build bundle, with ``bundle`` name.
+build_started = _signals.signal('rollup-build-started')
+#: Sent when bundle has been built, with ``bundle`` name and build ``stats``.
+build_finished = _signals.signal('rollup-build-finished')
+#: Sent when bundle did not need to be built, with ``bundle`` name and
+#: ``reason``, either ``unchanged``, ``cached`` or ``build-cache``.
+build_skipped = _signals.signal('rollup-build-skipped')
+#: Sent when bundle build failed, with ``bundle`` name, ``error`` and ``duration``.
+build_failed = _signals.signal('rollup-build-failed')
+
+
+def child_cpu_time() -> float:
+    """Return CPU time (user and system) used so far by terminated child
+    processes. When builds run concurrently the difference between two readings
+    includes all child processes that finished in between.
+
+    Returns:
+        float: CPU time in seconds, 0 if not available on the platform
+    """
+    if resource is None:  # pragma: no cover
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def resolve_launcher(rollup_path: str, node_path: str) -> List[str]:
+    """Find Rollup bin script behind its executable shim, so Rollup can be run
+    directly with Node.js instead of going through ``/usr/bin/env`` or shell
+    wrapper on every build. Symlinks (like ``node_modules/.bin/rollup``) are
+    followed, and for shell wrappers in ``node_modules/.bin`` the bin script of
+    ``rollup`` package is looked up.
+
+    Args:
+        rollup_path: Rollup executable, name or path
+        node_path: Node.js executable, name or path
+
+    Returns:
+        List[str]: command that runs Rollup, Rollup executable alone if bin
+        script or Node.js can't be found
+    """
+    rollup = shutil.which(rollup_path)
+    node = shutil.which(node_path)
+    if rollup is None or node is None:
+        return [rollup_path]
+    candidates = [os.path.realpath(rollup)]
+    bin_dir = os.path.dirname(os.path.abspath(rollup))
+    if os.path.basename(bin_dir) == '.bin':
+        candidates.append(os.path.join(
+            os.path.dirname(bin_dir), 'rollup', 'dist', 'bin', 'rollup'
+        ))
+    for path in candidates:
+        try:
+            with open(path, 'rb') as fp:
+                shebang = fp.readline()
+        except OSError:
+            continue
+        if shebang.startswith(b'#!') and b'node' in shebang:
+            return [node, path]
+    return [rollup_path]
+
+
+async def _acquire_in_thread(acquire: Callable[[], Any], release: Callable[[], Any]):
+    """Run blocking lock acquisition in default executor, so event loop is not
+    blocked while waiting. If waiting coroutine is cancelled, lock is released as
+    soon as it's acquired.
+    """
+    future = asyncio.get_running_loop().run_in_executor(None, acquire)
+
+    def release_acquired(f):
+        if not f.cancelled() and f.exception() is None:
+            release()
+    try:
+        await asyncio.shield(future)
+    except asyncio.CancelledError:
+        future.add_done_callback(release_acquired)
+        raise
+
+
+async def _kill(process: asyncio.subprocess.Process):
+    if process.returncode is None:
+        process.kill()
+        await process.wait()
 
 
 class RollupBundlerError(Exception):
@@ -35,6 +573,13 @@ class BundleDefinitionError(RollupBundlerError):
     pass
 
 
+class BuildInProgressError(RollupBundlerError):
+    """Exception raised if bundle is being rebuilt and rebuild policy does not
+    allow waiting for the build to finish.
+    """
+    pass
+
+
 @dataclass
 class Entrypoint:
     """Entrypoint information: path and name.
@@ -79,14 +624,26 @@ class Bundle:
         target_dir: where the output will be stored, relative to static directory root
         entrypoints: list of bundle entrypoints
         dependencies: list of entrypoint's dependencies that will be included in bundle
+        max_size: size budget of bundle output with its statically imported chunks,
+                  in bytes, defaults to None (application wide budget)
+        max_gzip_size: size budget of bundle output with its statically imported
+                       chunks after gzip compression, in bytes, defaults to None
+                       (application wide budget)
 
     Raises:
         BundleDefinitionError: if definition contains more than 1 unnamed entrypoint
     """
+    STATE_FILE = '.flask-rollup-state.json'
+
     name: str
     target_dir: str
     entrypoints: List[Union[Entrypoint, str]]
     dependencies: List[str] = field(default_factory=list)
+    max_size: Optional[int] = None
+    max_gzip_size: Optional[int] = None
+    modules: List[str] = field(default_factory=list, init=False)
+    imports: List[str] = field(default_factory=list, init=False)
+    chunks: List[str] = field(default_factory=list, init=False)
     state: Optional[str] = field(default=None, init=False)
     output: Optional[BundleOutput] = field(default=None, init=False)
 
@@ -125,46 +682,522 @@ class Bundle:
     def calc_state(self) -> str:
         """Calculate bundle state checksum. This is used to determine if bundle should
         be rebuilt in development mode. For each input path (entrypoints and
-        dependencies) file modification time is used as a base of calculation.
+        dependencies, both declared and discovered) checksum of file content is
+        used as a base of calculation, so touching files or switching between
+        branches with identical content does not change the state.
 
         Returns:
             str: bundle state checksum
         """
-        src = [str(os.stat(ep.path).st_mtime_ns) for ep in self.entrypoints]
-        src.extend([str(os.stat(d).st_mtime_ns) for d in self.dependencies])
+        src = []
+        for path in self.input_paths():
+            try:
+                src.append(f'{path}:{file_fingerprint(path)}')
+            except FileNotFoundError:
+                src.append(f'{path}:')
         return hashlib.sha256('\n'.join(src).encode('utf-8')).hexdigest()
 
-    def argv(self) -> List[str]:
+    def input_paths(self) -> List[str]:
+        """Return list of all bundle input paths (entrypoints, declared dependencies
+        and modules discovered while building bundle).
+
+        Returns:
+            List[str]: list of input file paths
+        """
+        rv = [ep.path for ep in self.entrypoints]
+        rv.extend(self.dependencies)
+        rv.extend(self.modules)
+        return list(dict.fromkeys(rv))
+
+    def apply_meta(self, meta: Mapping[str, Any]) -> bool:
+        """Update list of discovered modules and imported chunks from build
+        metadata. Only modules that are actual files are taken into account,
+        virtual modules created by Rollup plugins are skipped. Imported chunks are
+        all chunks statically imported by bundle output, directly or indirectly,
+        and required chunks include also dynamically imported ones.
+
+        Args:
+            meta: build metadata
+
+        Returns:
+            bool: ``True`` if list of modules has changed
+        """
+        chunks = meta.get('chunks')
+        if chunks:
+            self.imports = self._chunk_imports(chunks)
+            self.chunks = self._chunk_imports(chunks, dynamic=True)
+        entries = meta.get('entries')
+        if not entries:
+            return False
+        modules = set()
+        for ep in self.entrypoints:
+            modules.update(entries.get(ep.name, []))
+        modules = sorted(
+            m for m in modules
+            if not m.startswith('\0') and os.path.isabs(m) and os.path.isfile(m)
+        )
+        if modules == self.modules:
+            return False
+        self.modules = modules
+        return True
+
+    def _chunk_imports(
+        self, chunks: Mapping[str, Any], dynamic: bool = False
+    ) -> List[str]:
+        queue = [
+            file_name for file_name, chunk in chunks.items()
+            if chunk.get('isEntry') and chunk.get('name') == self.name
+        ]
+        seen = set(queue)
+        rv = []
+        while queue:
+            chunk = chunks.get(queue.pop(0)) or {}
+            imported = list(chunk.get('imports', []))
+            if dynamic:
+                imported.extend(chunk.get('dynamicImports', []))
+            for file_name in imported:
+                if file_name not in seen:
+                    seen.add(file_name)
+                    rv.append(os.path.join(self.target_dir, file_name))
+                    queue.append(file_name)
+        return rv
+
+    def import_urls(
+        self, root: str, url_path: str, dynamic: bool = False
+    ) -> List[str]:
+        """Return urls of chunks imported by bundle output.
+
+        Args:
+            root: static content root directory (application static folder)
+            url_path: path to static content
+            dynamic: include dynamically imported chunks
+
+        Returns:
+            List[str]: list of chunk urls
+        """
+        return [
+            os.path.join(url_path, path.replace(f'{root}/', ''))
+            for path in (self.chunks if dynamic else self.imports)
+        ]
+
+    def argv(self, target_dir: Optional[str] = None) -> List[str]:
         """Return list of Rollup command line params required to build the bundle.
 
+        Args:
+            target_dir: output directory, defaults to bundle target directory
+
         Returns:
             List[str]: list of command line param tokens
         """
-        rv = ['-d', self.target_dir]
+        rv = ['-d', target_dir or self.target_dir]
         for ep in self.entrypoints:
             rv.append(ep.cmdline_param())
         return rv
 
-    def clean_artifacts(self):
-        """Delete bundle artifacts (Javascript and maps).
+    def restore_state(self, environment: str, state_dir: Optional[str] = None) -> bool:
+        """Restore bundle state from state file. The state is restored only if it's
+        equal to current state calculated with saved list of discovered modules,
+        it was built for the same environment and its output is still present.
+        This allows reusing artifacts built by other process.
+
+        Args:
+            environment: build environment (``NODE_ENV``)
+            state_dir: directory of state file, defaults to target directory
+
+        Returns:
+            bool: ``True`` if state has been restored
+        """
+        data = read_json(os.path.join(state_dir or self.target_dir, self.STATE_FILE))
+        if not isinstance(data, dict):
+            return False
+        entry = data.get(self.name)
+        if not entry or entry.get('env') != environment:
+            return False
+        if not os.path.isfile(os.path.join(self.target_dir, entry.get('output', ''))):
+            return False
+        modules = self.modules
+        self.modules = entry.get('modules', [])
+        state = self.calc_state()
+        if state != entry.get('state'):
+            self.modules = modules
+            return False
+        self.state = state
+        self.imports = entry.get('imports', [])
+        self.chunks = entry.get('chunks', [])
+        return True
+
+    def save_state(self, environment: str, state_dir: Optional[str] = None):
+        """Persist bundle state and output in state file, so it may be reused by
+        other processes. State file contains paths of all bundle inputs, so it
+        should be kept outside of static folder. State file is shared by all
+        bundles in target directory, so it's updated under exclusive lock held on
+        lock file next to it. Failure to save state is not an error, the bundle
+        will be just rebuilt when needed.
+
+        Args:
+            environment: build environment (``NODE_ENV``)
+            state_dir: directory of state file, defaults to target directory
+        """
+        if self.state is None or self.output is None:
+            return
+        state_dir = state_dir or self.target_dir
+        path = os.path.join(state_dir, self.STATE_FILE)
+        entry = {
+            'state': self.state,
+            'env': environment,
+            'output': os.path.basename(self.output.file_path),
+            'modules': self.modules,
+            'imports': self.imports,
+            'chunks': self.chunks,
+        }
+        with _state_lock:
+            try:
+                os.makedirs(state_dir, exist_ok=True)
+                with _file_lock(f'{path}.lock'):
+                    data = read_json(path)
+                    if not isinstance(data, dict):
+                        data = {}
+                    data[self.name] = entry
+                    write_json(path, data)
+            except OSError:
+                pass
+
+    def artifacts(self, since_ns: int = 0) -> List[str]:
+        """Return list of bundle artifacts (Javascript and maps), optionally only
+        these that were modified at or after specified moment.
+
+        Args:
+            since_ns: minimal modification time in nanoseconds since the epoch
+
+        Returns:
+            List[str]: list of artifact paths
+        """
+        files = glob.glob(f'{self.target_dir}/{self.name}.*.js*')
+        if not since_ns:
+            return files
+        rv = []
+        for path in files:
+            try:
+                if os.stat(path).st_mtime_ns >= since_ns:
+                    rv.append(path)
+            except FileNotFoundError:
+                continue
+        return rv
+
+    def stale_artifacts(self, keep: Iterable[str] = ()) -> List[str]:
+        """Return bundle artifacts (Javascript, maps and their compressed variants)
+        other than specified ones. Compressed variants of kept artifacts are kept
+        too.
+
+        Args:
+            keep: paths of artifacts that should be kept
+
+        Returns:
+            List[str]: list of artifact paths
         """
+        keep = set(keep)
+        rv = []
         for path in glob.glob(f'{self.target_dir}/{self.name}.*.js*'):
+            base, ext = os.path.splitext(path)
+            if ext in COMPRESSED_SUFFIXES.values() and base in keep:
+                continue
+            if path not in keep:
+                rv.append(path)
+        return rv
+
+    def clean_artifacts(self, keep: Iterable[str] = ()):
+        """Delete bundle artifacts (Javascript, maps and their compressed variants).
+        Compressed variants of kept artifacts are kept too.
+
+        Args:
+            keep: paths of artifacts that should not be deleted
+        """
+        for path in self.stale_artifacts(keep):
             os.remove(path)
 
-    def resolve_output(self, root: str, url_path: str):
+    def latest_artifacts(self) -> List[str]:
+        """Return most recent bundle output and its source map.
+
+        Returns:
+            List[str]: list of artifact paths, empty if there's no output
+        """
+        files = glob.glob(f'{self.target_dir}/{self.name}.*.js')
+        if not files:
+            return []
+        newest = files[0]
+        if len(files) > 1:
+            newest = max(files, key=lambda path: os.stat(path).st_mtime_ns)
+        return [newest, f'{newest}.map']
+
+    def compress_artifacts(self, encodings: Iterable[str]) -> List[str]:
+        """Write compressed variants of bundle artifacts (Javascript and maps),
+        including chunks the bundle imports.
+
+        Args:
+            encodings: content encodings, ``gzip`` or ``br``
+
+        Returns:
+            List[str]: paths of written files
+        """
+        suffixes = tuple(COMPRESSED_SUFFIXES.values())
+        paths = [path for path in self.artifacts() if not path.endswith(suffixes)]
+        for path in self.chunks:
+            paths.extend(p for p in (path, f'{path}.map') if os.path.isfile(p))
+        rv = []
+        for path in paths:
+            rv.extend(precompress(path, encodings))
+        return rv
+
+    def prune_artifacts(self):
+        """Delete all but the most recent bundle artifacts. This is required when
+        Rollup is not cleaning after itself, eg. in watch mode every rebuild of
+        changed code produces new set of files.
+        """
+        self.clean_artifacts(keep=self.latest_artifacts())
+
+    def output_sizes(self) -> Tuple[int, int]:
+        """Return size of bundle output together with all chunks it imports
+        statically, which is what browser has to load before bundle code runs.
+
+        Returns:
+            Tuple[int, int]: raw and gzip compressed size in bytes
+        """
+        paths = list(self.imports)
+        if self.output is not None:
+            paths.insert(0, self.output.file_path)
+        paths = [path for path in paths if os.path.isfile(path)]
+        return (
+            sum(os.stat(path).st_size for path in paths),
+            sum(gzip_size(path) for path in paths),
+        )
+
+    def resolve_output(
+        self, root: str, url_path: str, algorithm: Optional[str] = None,
+        ignore: Iterable[str] = (),
+    ):
         """Determine bundle's generation output paths (both absolute file system path
-        and relative to static folder) and url.
+        and relative to static folder) and url. If hash algorithm is provided,
+        Subresource Integrity value of output file is calculated too. Superseded
+        artifacts may be kept for a while after rebuild, so if there is more than
+        one output file, the most recent one is used.
 
         Args:
             root: static content root directory (application static folder)
             url_path: path to static content
+            algorithm: integrity hash algorithm, defaults to None
+            ignore: paths of files that are known to be superseded
         """
-        files = glob.glob(f'{self.target_dir}/{self.name}.*.js')
+        ignore = set(ignore)
+        files = [
+            path for path in glob.glob(f'{self.target_dir}/{self.name}.*.js')
+            if path not in ignore
+        ]
+        if len(files) > 1:
+            try:
+                files = [max(files, key=lambda path: os.stat(path).st_mtime_ns)]
+            except OSError:
+                return
         if len(files) == 1:
             output_path = files[0]
             path = output_path.replace(f'{root}/', '')
             url = os.path.join(url_path, path)
-            self.output = BundleOutput(output_path, path, url)
+            integrity = None
+            if algorithm:
+                try:
+                    integrity = file_integrity(output_path, algorithm)
+                except OSError:
+                    pass
+            self.output = BundleOutput(output_path, path, url, integrity)
+
+
+@dataclass
+class BuildSpec:
+    """Precomputed parameters of Rollup run that builds bundle (or group of
+    bundles sharing target directory), so they're not computed on every build.
+
+    Args:
+        command: Rollup launcher with configuration file param
+        params: entrypoint params
+        target_dir: default output directory
+        env: environment of Rollup process
+        cwd: working directory of Rollup process
+        config_path: resolved path of Rollup configuration file, if set
+    """
+    command: List[str]
+    params: List[str]
+    target_dir: str
+    env: Mapping[str, str]
+    cwd: str
+    config_path: Optional[str] = None
+
+    def argv(self, target_dir: Optional[str] = None) -> List[str]:
+        """Return full Rollup command line.
+
+        Args:
+            target_dir: output directory, defaults to spec target directory
+
+        Returns:
+            List[str]: list of command line param tokens
+        """
+        return [*self.command, '-d', target_dir or self.target_dir, *self.params]
+
+
+@dataclass
+class StagedBuild:
+    """Progress of build which output is written to staging directory.
+
+    Args:
+        staging_dir: directory Rollup writes to
+        start_ns: time the build started, in nanoseconds since the epoch
+        meta: build metadata, once Rollup finished or output has been restored
+              from build cache
+        timing: duration and CPU time of Rollup run, ``None`` if Rollup has not
+                been run
+    """
+    staging_dir: str
+    start_ns: int
+    meta: Optional[Dict[str, Any]] = None
+    timing: Optional[Tuple[float, float]] = None
+
+
+class RollupWatcher:
+    """Long running Rollup process in watch mode. Rollup keeps module graph of
+    watched inputs in memory and rebuilds bundles incrementally on every change to
+    any of input files. Progress of the process is tracked by parsing its
+    diagnostic output.
+
+    Args:
+        argv: Rollup command line, without watch flag
+        env: environment of Rollup process
+        cwd: working directory of Rollup process, defaults to current directory
+    """
+
+    def __init__(
+        self, argv: List[str], env: Mapping[str, str], cwd: Optional[str] = None
+    ):
+        self.argv = argv + ['-w', '--no-watch.clearScreen']
+        self.cwd = cwd
+        self.env = dict(env)
+        self.env['NO_COLOR'] = '1'
+        fd, self.meta_path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        self.env['FLASK_ROLLUP_META'] = self.meta_path
+        self.process: Optional[subprocess.Popen] = None
+        self.building = False
+        self.build_started_ns = 0
+        self.build_failed = False
+        self.builds = 0
+        self._cond = threading.Condition()
+
+    @property
+    def running(self) -> bool:
+        """Whether Rollup process is alive.
+        """
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        """Launch Rollup process and start tracking its progress.
+        """
+        self.process = subprocess.Popen(
+            self.argv, env=self.env, cwd=self.cwd, stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            text=True, encoding='utf-8', errors='replace',
+        )
+        threading.Thread(target=self._track, daemon=True).start()
+
+    def stop(self):
+        """Terminate Rollup process.
+        """
+        if self.running:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:  # pragma: no cover
+                self.process.kill()
+        if os.path.isfile(self.meta_path):
+            os.remove(self.meta_path)
+
+    def meta(self) -> Dict[str, Any]:
+        """Return metadata of the most recent build.
+
+        Returns:
+            Dict[str, Any]: build metadata
+        """
+        return read_build_meta(self.meta_path)
+
+    def _track(self):
+        for line in self.process.stderr:
+            line = line.strip()
+            with self._cond:
+                if line.startswith('bundles '):
+                    self.building = True
+                    started_ns = time.time_ns()
+                elif line.startswith('created ') and self.building:
+                    self._finish(started_ns, False)
+                elif line.startswith('[!]') and self.building:
+                    self._finish(started_ns, True)
+        with self._cond:
+            self.building = False
+            self._cond.notify_all()
+
+    def _finish(self, started_ns: int, failed: bool):
+        self.building = False
+        self.build_started_ns = started_ns
+        self.build_failed = failed
+        self.builds += 1
+        self._cond.notify_all()
+
+    def wait(self, since_ns: int, timeout: Optional[float] = None) -> bool:
+        """Wait for completion of build that started after specified moment. In
+        watch mode Rollup rebuilds bundle after each change so this moment should
+        be the time of most recent change to any of bundle inputs.
+
+        Args:
+            since_ns: time in nanoseconds since the epoch
+            timeout: maximum time to wait in seconds, waits indefinitely if
+                     not provided
+
+        Returns:
+            bool: ``True`` if successful build has been completed
+        """
+        def done():
+            if not self.running:
+                return True
+            return (
+                self.builds > 0 and not self.building
+                and self.build_started_ns >= since_ns
+            )
+        with self._cond:
+            self._cond.wait_for(done, timeout)
+            return (
+                self.builds > 0 and not self.building and not self.build_failed
+                and self.build_started_ns >= since_ns
+            )
+
+
+class InputsEventHandler:
+    """File system event handler that marks bundles as dirty when any of their
+    inputs change. Only events that signal change of file content or its
+    location are handled, others (eg. file being opened or closed) are ignored.
+
+    Args:
+        rollup: extension object
+    """
+    EVENT_TYPES = ('created', 'modified', 'moved', 'deleted')
+
+    def __init__(self, rollup: 'Rollup'):
+        self.rollup = rollup
+
+    def dispatch(self, event):
+        """Handle file system event.
+
+        Args:
+            event: watchdog file system event
+        """
+        if event.event_type not in self.EVENT_TYPES:
+            return
+        paths = {event.src_path, getattr(event, 'dest_path', None)}
+        self.rollup.invalidate(paths)
 
 
 @dataclass
@@ -172,12 +1205,62 @@ class Rollup:
     """Rollup integration with Flask. Extension can be registered in both simple way
     or with ``init_app(app)`` pattern.
     """
+    REBUILD_POLICIES = ('block', 'stale', 'fail')
+
     app: Optional[Flask] = None
     bundles: Mapping[str, Bundle] = field(default_factory=dict, init=False)
     argv: List[str] = field(default_factory=list, init=False)
+    launcher: List[str] = field(default_factory=list, init=False)
+    env: Dict[str, str] = field(default_factory=dict, init=False)
+    cwd: Optional[str] = field(default=None, init=False)
+    build_specs: Dict[str, BuildSpec] = field(default_factory=dict, init=False)
     mode_production: bool = field(default=True, init=False)
     static_folder: Optional[str] = field(default=None, init=False)
     static_url_path: Optional[str] = field(default=None, init=False)
+    url_path: Optional[str] = field(default=None, init=False)
+    cache_max_age: int = field(default=31536000, init=False)
+    x_accel_redirect: Optional[str] = field(default=None, init=False)
+    manifest_path: Optional[str] = field(default=None, init=False)
+    manifest: Optional[Dict[str, Any]] = field(default=None, init=False)
+    _manifest_files: Dict[str, Any] = field(default_factory=dict, init=False)
+    state_cache: bool = field(default=True, init=False)
+    watch: bool = field(default=False, init=False)
+    watch_timeout: float = field(default=30, init=False)
+    watchers: Dict[str, RollupWatcher] = field(default_factory=dict, init=False)
+    rebuild_policy: str = field(default='block', init=False)
+    compress: List[str] = field(default_factory=list, init=False)
+    shared_chunks: bool = field(default=False, init=False)
+    check_interval: float = field(default=0, init=False)
+    observer: Optional[Any] = field(default=None, init=False)
+    watch_node_modules: bool = field(default=False, init=False)
+    lazy: bool = field(default=False, init=False)
+    _pending: Set[str] = field(default_factory=set, init=False)
+    _refs: Dict[str, BundleRef] = field(default_factory=dict, init=False)
+    sri_algorithm: Optional[str] = field(default='sha384', init=False)
+    stats: Dict[str, Dict[str, Any]] = field(default_factory=dict, init=False)
+    max_size: Optional[int] = field(default=None, init=False)
+    max_gzip_size: Optional[int] = field(default=None, init=False)
+    config_path: str = field(default='rollup.config.js', init=False)
+    _resolved_config_path: Optional[str] = field(default=None, init=False)
+    build_cache: Optional[BuildCache] = field(default=None, init=False)
+    _rollup_version: Optional[str] = field(default=None, init=False)
+    gc_grace: float = field(default=0, init=False)
+    process_lock: bool = field(default=False, init=False)
+    work_dir: Optional[str] = field(default=None, init=False)
+    output_lines: int = field(default=100, init=False)
+    build_output: Dict[str, Deque[OutputRecord]] = field(
+        default_factory=dict, init=False
+    )
+    error_overlay: bool = field(default=False, init=False)
+    failures: Dict[str, Exception] = field(default_factory=dict, init=False)
+    _garbage: Dict[str, float] = field(default_factory=dict, init=False)
+    _resolve_lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+    _build_locks: Dict[str, threading.Lock] = field(default_factory=dict, init=False)
+    _background: Dict[str, threading.Thread] = field(default_factory=dict, init=False)
+    _checked: Dict[str, float] = field(default_factory=dict, init=False)
+    _dirty: Set[str] = field(default_factory=set, init=False)
+    _watched_dirs: Set[str] = field(default_factory=set, init=False)
 
     def __post_init__(self):
         if self.app:
@@ -186,8 +1269,9 @@ class Rollup:
     def init_app(self, app: Flask):
         """Initialise application. This function sets up required configuration
         defaults and initial Rollup command line args. In non-production mode
-        autorebuild is enabled. Template function ``jsbundle`` is registered here
-        as Jinja2 global object.
+        autorebuild is enabled, optionally with long running Rollup processes in
+        watch mode. Template function ``jsbundle`` is registered here as Jinja2
+        global object.
 
         Args:
             app: application object
@@ -195,64 +1279,1525 @@ class Rollup:
         self.mode_production = os.environ.get('FLASK_ENV', 'production') == 'production'
         self.static_folder = app.static_folder
         self.static_url_path = app.static_url_path
+        self.url_path = self.static_url_path
+        serve_url_path = app.config.get('ROLLUP_SERVE_URL_PATH')
+        if serve_url_path:
+            self.url_path = serve_url_path.rstrip('/')
+            app.add_url_rule(
+                f'{self.url_path}/<path:filename>', endpoint='rollup_bundle',
+                view_func=self.send_bundle_file,
+            )
+        app.config.setdefault('ROLLUP_CACHE_MAX_AGE', 31536000)
+        self.cache_max_age = app.config['ROLLUP_CACHE_MAX_AGE']
+        self.x_accel_redirect = app.config.get('ROLLUP_X_ACCEL_REDIRECT')
         app.config.setdefault('ROLLUP_PATH', 'rollup')
-        self.argv = [app.config['ROLLUP_PATH']]
+        self.cwd = os.getcwd()
+        self.env = os.environ.copy()
+        self.env['NODE_ENV'] = self.env.get('FLASK_ENV', 'production')
+        self.launcher = [app.config['ROLLUP_PATH']]
+        node_path = app.config.get('ROLLUP_NODE')
+        if node_path:
+            self.launcher = resolve_launcher(app.config['ROLLUP_PATH'], node_path)
+        self.argv = self.launcher + ['-c']
         rollup_config_js = app.config.get('ROLLUP_CONFIG_JS')
         if rollup_config_js:
-            self.argv.extend(['-c', rollup_config_js])
-        else:
-            self.argv.append('-c')
+            self.config_path = rollup_config_js
+            self._resolved_config_path = os.path.join(self.cwd, rollup_config_js)
+            self.argv.append(self._resolved_config_path)
+        build_cache = app.config.get('ROLLUP_BUILD_CACHE')
+        if isinstance(build_cache, str):
+            build_cache = LocalBuildCache(
+                build_cache, app.config.get('ROLLUP_BUILD_CACHE_SIZE')
+            )
+        self.build_cache = build_cache
+        app.config.setdefault(
+            'ROLLUP_WORK_DIR', os.path.join(app.instance_path, 'flask-rollup')
+        )
+        self.work_dir = app.config['ROLLUP_WORK_DIR']
+        app.config.setdefault('ROLLUP_GC_GRACE', 0)
+        self.gc_grace = app.config['ROLLUP_GC_GRACE']
+        app.config.setdefault('ROLLUP_PROCESS_LOCK', False)
+        self.process_lock = app.config['ROLLUP_PROCESS_LOCK']
+        if self.process_lock and fcntl is None:  # pragma: no cover
+            raise RollupBundlerError('Process lock is not supported on this platform')
+        if self.static_folder:
+            app.config.setdefault(
+                'ROLLUP_MANIFEST',
+                os.path.join(self.static_folder, 'rollup-manifest.json'),
+            )
+        self.manifest_path = app.config.get('ROLLUP_MANIFEST')
+        app.config.setdefault('ROLLUP_STATE_CACHE', True)
+        self.state_cache = app.config['ROLLUP_STATE_CACHE']
+        app.config.setdefault('ROLLUP_WATCH', False)
+        app.config.setdefault('ROLLUP_WATCH_TIMEOUT', 30)
+        self.watch = not self.mode_production and app.config['ROLLUP_WATCH']
+        self.watch_timeout = app.config['ROLLUP_WATCH_TIMEOUT']
+        if self.watch:
+            atexit.register(self.stop_watchers)
+        app.config.setdefault('ROLLUP_REBUILD_POLICY', 'block')
+        self.rebuild_policy = app.config['ROLLUP_REBUILD_POLICY']
+        if self.rebuild_policy not in self.REBUILD_POLICIES:
+            raise RollupBundlerError(f'Unknown rebuild policy {self.rebuild_policy}')
+        app.config.setdefault('ROLLUP_SHARED_CHUNKS', False)
+        self.shared_chunks = app.config['ROLLUP_SHARED_CHUNKS']
+        if self.shared_chunks and self.watch:
+            raise RollupBundlerError(
+                'Shared chunks can not be used with Rollup in watch mode'
+            )
+        app.config.setdefault('ROLLUP_COMPRESS', [])
+        self.compress = list(app.config['ROLLUP_COMPRESS'])
+        for encoding in self.compress:
+            if encoding not in COMPRESSED_SUFFIXES:
+                raise RollupBundlerError(f'Unsupported content encoding {encoding}')
+        app.config.setdefault('ROLLUP_CHECK_INTERVAL', 0)
+        self.check_interval = app.config['ROLLUP_CHECK_INTERVAL']
+        app.config.setdefault('ROLLUP_FS_EVENTS', False)
+        if not self.mode_production and app.config['ROLLUP_FS_EVENTS']:
+            if Observer is None:
+                raise RollupBundlerError(
+                    'File system events require watchdog package to be installed'
+                )
+            self.observer = Observer()
+            self.observer.daemon = True
+            self.observer.start()
+            atexit.register(self.observer.stop)
+        app.config.setdefault('ROLLUP_FS_EVENTS_NODE_MODULES', False)
+        self.watch_node_modules = app.config['ROLLUP_FS_EVENTS_NODE_MODULES']
+        app.config.setdefault('ROLLUP_SRI_ALGORITHM', 'sha384')
+        self.sri_algorithm = app.config['ROLLUP_SRI_ALGORITHM']
+        if self.sri_algorithm and self.sri_algorithm not in SRI_ALGORITHMS:
+            raise RollupBundlerError(
+                f'Unsupported integrity algorithm {self.sri_algorithm}'
+            )
+        self.max_size = app.config.get('ROLLUP_MAX_SIZE')
+        self.max_gzip_size = app.config.get('ROLLUP_MAX_GZIP_SIZE')
+        stats_url_path = app.config.get('ROLLUP_STATS_URL_PATH')
+        if stats_url_path:
+            app.add_url_rule(
+                stats_url_path, endpoint='rollup_stats', view_func=self.stats_view
+            )
+        app.config.setdefault('ROLLUP_LAZY', False)
+        self.lazy = self.mode_production and app.config['ROLLUP_LAZY']
+        app.config.setdefault('ROLLUP_OUTPUT_LINES', 100)
+        self.output_lines = app.config['ROLLUP_OUTPUT_LINES']
+        app.config.setdefault('ROLLUP_ERROR_OVERLAY', True)
+        self.error_overlay = (
+            not self.mode_production and app.config['ROLLUP_ERROR_OVERLAY']
+        )
 
         if not self.mode_production:
             @app.before_request
             def run_rollup():
                 if request.endpoint in self.bundles:
-                    self.run_rollup(request.endpoint)
+                    try:
+                        self.rebuild(request.endpoint)
+                    except (OSError, subprocess.SubprocessError) as e:
+                        if not self.error_overlay:
+                            raise
+                        logger.error(
+                            'Failed to build bundle %s: %s', request.endpoint, e
+                        )
+                        if self.bundles[request.endpoint].output is None:
+                            # page can't be rendered without bundle, serve empty
+                            # page that gets error overlay added below
+                            return Response(
+                                '<!doctype html>\n<html><body></body></html>',
+                                status=500, mimetype='text/html',
+                            )
+
+        if self.error_overlay:
+            @app.after_request
+            def add_error_overlay(response):
+                if request.endpoint not in self.bundles:
+                    return response
+                return self.add_error_overlay(request.endpoint, response)
 
         @app.template_global(name='jsbundle')
         def template_func(name: str):
-            bundle = self.bundles[name]
-            if bundle.output:
-                return bundle.output.url
-            raise RuntimeError(f'Bundle {name} not generated')
+            return self.bundle_ref(name).url
+
+        @app.template_global(name='jsbundle_tag')
+        def tag_func(name: str):
+            return self.bundle_ref(name).tag
+
+        @app.template_global(name='jsbundle_integrity')
+        def integrity_func(name: str):
+            return self.bundle_ref(name).output.integrity
+
+        @app.template_global(name='jsbundle_preloads')
+        def preloads_func(name: str):
+            return self.preload_urls(name)
+
+        @app.template_global(name='jsbundle_chunks')
+        def chunks_func(name: str):
+            return self.resolve(name).import_urls(
+                self.static_folder, self.url_path, dynamic=True
+            )
+
+        app.config.setdefault('ROLLUP_PRELOAD_HEADERS', False)
+        if app.config['ROLLUP_PRELOAD_HEADERS']:
+            @app.after_request
+            def add_preload_headers(response):
+                if request.endpoint not in self.bundles:
+                    return response
+                bundle = self.resolve(request.endpoint)
+                if bundle.output is not None:
+                    urls = [bundle.output.url]
+                    urls.extend(self.preload_urls(bundle.name))
+                    for url in urls:
+                        response.headers.add('Link', f'<{url}>; rel=modulepreload')
+                return response
 
         app.extensions['rollup'] = self
 
     def register(self, bundle: Bundle):
-        """Register bundle. At this moment input paths are resolved. If any
-        output matching file is present, the bundle output is resolved with
-        short circuit, generated otherwise.
+        """Register bundle. At this moment input paths are resolved. In production
+        mode bundle output is taken from build manifest if it's present there.
+        Otherwise if any output matching file is present, the bundle output is
+        resolved with short circuit, generated otherwise. In lazy mode only bundle
+        definition is recorded and resolution is deferred until bundle is used
+        for the first time.
 
         Args:
             bundle: bundle object to be registered
         """
         self.bundles[bundle.name] = bundle
+        if self.lazy:
+            with self._resolve_lock:
+                self._pending.add(bundle.name)
+            return
+        self._register(bundle)
+
+    def _register(self, bundle: Bundle):
         bundle.resolve_paths(self.static_folder)
-        bundle.resolve_output(self.static_folder, self.static_url_path)
+        self.build_specs[bundle.name] = self._build_spec(
+            bundle.target_dir, [bundle]
+        )
+        if self.mode_production:
+            if self.manifest is None:
+                self.load_manifest()
+            entry = self.manifest.get(bundle.name)
+            if entry:
+                bundle.output = BundleOutput(
+                    os.path.join(self.static_folder, entry['file']), entry['file'],
+                    os.path.join(self.url_path, entry['file']), entry.get('integrity'),
+                )
+                bundle.imports = [
+                    os.path.join(self.static_folder, path)
+                    for path in entry.get('imports', [])
+                ]
+                bundle.chunks = [
+                    os.path.join(self.static_folder, path)
+                    for path in entry.get('chunks', [])
+                ]
+                return
+        self._resolve_output(bundle)
+        if self.observer is not None:
+            with self._lock:
+                self._dirty.add(bundle.name)
+            self._watch_inputs(bundle)
         if not self.mode_production and bundle.output is None:
-            self.run_rollup(bundle.name)
+            try:
+                self.run_rollup(bundle.name)
+            except (OSError, subprocess.SubprocessError) as e:
+                if not self.error_overlay:
+                    raise
+                logger.error('Failed to build bundle %s: %s', bundle.name, e)
+
+    def resolve(self, bundle_name: str) -> Bundle:
+        """Return registered bundle, completing its registration first if it has
+        been deferred in lazy mode. Resolution is done only once, subsequent
+        calls return memoised bundle.
+
+        Args:
+            bundle_name: name of the bundle
+
+        Returns:
+            Bundle: resolved bundle object
+        """
+        bundle = self.bundles[bundle_name]
+        if bundle_name in self._pending:
+            with self._resolve_lock:
+                if bundle_name in self._pending:
+                    self._register(bundle)
+                    self._pending.discard(bundle_name)
+        return bundle
 
-    def run_rollup(self, bundle_name: str):
+    def warm(self):
+        """Resolve all bundles which registration has been deferred in lazy mode.
+        Preforking servers should call this before forking workers so the work is
+        done once in parent process.
+        """
+        for name in list(self._pending):
+            self.resolve(name)
+
+    def bundle_ref(self, bundle_name: str) -> BundleRef:
+        """Return precomputed url and HTML script tag of bundle output. Values
+        are computed once per bundle output and reused until the output changes.
+
+        Args:
+            bundle_name: name of the bundle
+
+        Raises:
+            RuntimeError: if bundle output has not been generated
+
+        Returns:
+            BundleRef: bundle output with its url and script tag
+        """
+        ref = self._refs.get(bundle_name)
+        if ref is not None and ref.output is self.bundles[bundle_name].output:
+            return ref
+        output = self.resolve(bundle_name).output
+        if output is None:
+            raise RuntimeError(f'Bundle {bundle_name} not generated')
+        attrs = f'type="module" src="{escape(output.url)}"'
+        if output.integrity:
+            attrs = f'{attrs} integrity="{escape(output.integrity)}"'
+            attrs = f'{attrs} crossorigin="anonymous"'
+        ref = BundleRef(output, output.url, Markup(f'<script {attrs}></script>'))
+        self._refs[bundle_name] = ref
+        return ref
+
+    def _build_spec(self, target_dir: str, bundles: List[Bundle]) -> BuildSpec:
+        command = list(self.argv)
+        params = [
+            ep.cmdline_param() for bundle in bundles for ep in bundle.entrypoints
+        ]
+        return BuildSpec(
+            command, params, target_dir, self.env, self.cwd,
+            self._resolved_config_path,
+        )
+
+    def error_overlay_html(self, bundle_name: str) -> Optional[Markup]:
+        """Return HTML of overlay that displays output of the last build of bundle,
+        if the build failed.
+
+        Args:
+            bundle_name: name of the bundle
+
+        Returns:
+            Optional[Markup]: overlay HTML, None if the last build did not fail
+        """
+        error = self.failures.get(bundle_name)
+        if error is None:
+            return None
+        output = getattr(error, 'output', None) or str(error)
+        return Markup(ERROR_OVERLAY).format(name=bundle_name, output=output)
+
+    def add_error_overlay(self, bundle_name: str, response: Response) -> Response:
+        """Add overlay that displays output of failed bundle build to HTML
+        response, right before closing ``body`` tag.
+
+        Args:
+            bundle_name: name of the bundle
+            response: response object
+
+        Returns:
+            Response: response object
+        """
+        if response.mimetype != 'text/html' or response.direct_passthrough:
+            return response
+        if response.is_streamed:
+            return response
+        overlay = self.error_overlay_html(bundle_name)
+        if overlay is None:
+            return response
+        html = response.get_data(as_text=True)
+        pos = html.rfind('</body>')
+        if pos < 0:
+            pos = len(html)
+        response.set_data(html[:pos] + str(overlay) + html[pos:])
+        return response
+
+    def _resolve_output(self, bundle: Bundle):
+        with self._lock:
+            ignore = list(self._garbage)
+        bundle.resolve_output(
+            self.static_folder, self.url_path, self.sri_algorithm, ignore
+        )
+
+    def preload_urls(self, bundle_name: str) -> List[str]:
+        """Return urls of all chunks imported by bundle output, so browser can
+        fetch them in parallel with the bundle itself instead of discovering them
+        one import level at a time.
+
+        Args:
+            bundle_name: name of the bundle
+
+        Returns:
+            List[str]: list of chunk urls
+        """
+        return self.resolve(bundle_name).import_urls(self.static_folder, self.url_path)
+
+    def send_bundle_file(self, filename: str):
+        """View function that serves files from bundle target directories. Bundle
+        artifacts have content hash in names so they are served with headers that
+        allow caching them forever, and strong ETags. If client accepts compressed
+        content and compressed variant of requested file exists, it's served
+        instead. Compressed variants can't be requested directly, as they would be
+        served without proper content encoding. File content may be delivered by
+        front end web server with either ``X-Sendfile`` (if Flask
+        ``USE_X_SENDFILE`` is enabled) or ``X-Accel-Redirect`` (if
+        ``ROLLUP_X_ACCEL_REDIRECT`` is set) header.
+
+        Args:
+            filename: file path relative to static folder
+
+        Returns:
+            Response: file response
+        """
+        path = resolve_path(self.static_folder, filename)
+        self.warm()
+        target_dirs = {bundle.target_dir for bundle in self.bundles.values()}
+        if (
+            os.path.dirname(path) not in target_dirs
+            or os.path.basename(path).startswith('.')
+            or path.endswith(tuple(COMPRESSED_SUFFIXES.values()))
+            or not os.path.isfile(path)
+        ):
+            abort(404)
+        static_path = path.replace(f'{self.static_folder}/', '')
+        available = [
+            encoding for encoding, suffix in COMPRESSED_SUFFIXES.items()
+            if os.path.isfile(f'{path}{suffix}')
+        ]
+        encoding = request.accept_encodings.best_match(sorted(available))
+        file_path = path
+        if encoding:
+            file_path = f'{path}{COMPRESSED_SUFFIXES[encoding]}'
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if self.x_accel_redirect:
+            rv = current_app.response_class(mimetype=mimetype)
+            rv.headers['X-Accel-Redirect'] = (
+                f'{self.x_accel_redirect.rstrip("/")}/{static_path}'
+                f'{COMPRESSED_SUFFIXES[encoding] if encoding else ""}'
+            )
+        elif current_app.config.get('USE_X_SENDFILE'):
+            rv = current_app.response_class(mimetype=mimetype)
+            rv.headers['X-Sendfile'] = file_path
+        else:
+            rv = current_app.response_class(
+                wrap_file(request.environ, open(file_path, 'rb')),
+                mimetype=mimetype, direct_passthrough=True,
+            )
+            rv.content_length = os.stat(file_path).st_size
+        if encoding:
+            rv.content_encoding = encoding
+        rv.vary.add('Accept-Encoding')
+        rv.set_etag(self._etag(static_path, encoding))
+        rv.headers['Cache-Control'] = (
+            f'public, max-age={self.cache_max_age}, immutable'
+        )
+        return rv.make_conditional(request)
+
+    def _etag(self, static_path: str, encoding: Optional[str]) -> str:
+        entry = self._manifest_files.get(static_path)
+        if entry and entry.get('integrity'):
+            etag = entry['integrity']
+        else:
+            etag = os.path.basename(static_path)
+        if encoding:
+            etag = f'{etag}-{encoding}'
+        return etag
+
+    def load_manifest(self):
+        """Load build manifest from file. Missing or invalid manifest is treated
+        as empty.
+        """
+        data = None
+        if self.manifest_path:
+            data = read_json(self.manifest_path)
+        if not isinstance(data, dict):
+            data = {}
+        self._set_manifest(data)
+
+    def _set_manifest(self, manifest: Dict[str, Any]):
+        self.manifest = manifest
+        self._manifest_files = {
+            entry['file']: entry for entry in manifest.values() if entry.get('file')
+        }
+
+    def write_manifest(self):
+        """Write build manifest file. Manifest contains information on generated
+        output of every built bundle: Javascript file and its source map paths
+        relative to static folder, file size, total size of bundle and its
+        statically imported chunks (raw and gzipped), integrity hash and bundle
+        state.
+        In production mode the manifest is used to resolve bundle outputs at
+        application startup instead of scanning target directories.
+        """
+        self.warm()
+        manifest = {}
+        for name, bundle in self.bundles.items():
+            if bundle.output is None:
+                continue
+            file_path = bundle.output.file_path
+            map_path = f'{file_path}.map'
+            total_size, total_gzip_size = bundle.output_sizes()
+            manifest[name] = {
+                'file': bundle.output.static_path,
+                'map': (
+                    f'{bundle.output.static_path}.map'
+                    if os.path.isfile(map_path) else None
+                ),
+                'size': os.stat(file_path).st_size,
+                'total_size': total_size,
+                'total_gzip_size': total_gzip_size,
+                'integrity': bundle.output.integrity or (
+                    file_integrity(file_path, self.sri_algorithm)
+                    if self.sri_algorithm else None
+                ),
+                'state': bundle.state,
+                'imports': [
+                    path.replace(f'{self.static_folder}/', '')
+                    for path in bundle.imports
+                ],
+                'chunks': [
+                    path.replace(f'{self.static_folder}/', '')
+                    for path in bundle.chunks
+                ],
+            }
+        write_json(self.manifest_path, manifest)
+        self._set_manifest(manifest)
+
+    def size_report(
+        self, previous: Optional[Mapping[str, Any]] = None
+    ) -> List[SizeReport]:
+        """Return sizes of all bundles that have output, along with sizes recorded
+        in previous build manifest and size budgets. Bundle budget takes
+        precedence over application wide one.
+
+        Args:
+            previous: previous build manifest, defaults to None
+
+        Returns:
+            List[SizeReport]: size reports ordered by bundle name
+        """
+        self.warm()
+        previous = previous or {}
+        rv = []
+        for name, bundle in sorted(self.bundles.items()):
+            if bundle.output is None:
+                continue
+            size, gzipped = bundle.output_sizes()
+            entry = previous.get(name) or {}
+            rv.append(SizeReport(
+                name, size, gzipped, entry.get('total_size'),
+                entry.get('total_gzip_size'),
+                bundle.max_size if bundle.max_size is not None else self.max_size,
+                bundle.max_gzip_size if bundle.max_gzip_size is not None
+                else self.max_gzip_size,
+            ))
+        return rv
+
+    def run_rollup(self, bundle_name: str, force: bool = False) -> bool:
         """Run Rollup bundler over specified bundle if bundle state changed. Once
-        Rollup finishes bundle's output is resolved (paths and url).
+        Rollup finishes bundle's output is resolved (paths and url). If state cache
+        is enabled and bundle with the same state has already been built by any
+        process, its artifacts are reused. In watch mode the bundle is rebuilt by
+        Rollup process that watches its inputs, and this function only waits for
+        build that is in progress. With shared chunks enabled all bundles in the
+        same target directory are built together.
 
         Args:
             bundle_name: name of the bundle to be rebuilt
+            force: rebuild bundle regardless of its state
+
+        Returns:
+            bool: ``True`` if Rollup has been run
+        """
+        bundle = self.resolve(bundle_name)
+        if self.watch:
+            self._wait_for_watcher(bundle)
+            return False
+        with self._build_lock(bundle_name):
+            if self.shared_chunks:
+                return self._build_shared(bundle, force)
+            return self._build(bundle, force)
+
+    def _build_lock(self, bundle_name: str) -> threading.Lock:
+        key = bundle_name
+        if self.shared_chunks:
+            key = f'{self.bundles[bundle_name].target_dir}/'
+        with self._lock:
+            return self._build_locks.setdefault(key, threading.Lock())
+
+    def _build_shared(self, bundle: Bundle, force: bool) -> bool:
+        self.warm()
+        group = [
+            b for b in self.bundles.values() if b.target_dir == bundle.target_dir
+        ]
+        if not force and self._group_fresh(bundle, group):
+            return False
+        results = self._build_group(bundle.target_dir, group, force)
+        for result in results:
+            if not result.success:
+                raise result.error
+        return any(result.built for result in results)
+
+    def _group_fresh(self, bundle: Bundle, group: List[Bundle]) -> bool:
+        if not all(self._skip_reason(b) for b in group):
+            return False
+        if bundle.output is None:
+            self._resolve_output(bundle)
+        self._emit(build_skipped, bundle.name, reason='unchanged')
+        return True
+
+    def _skip_reason(self, bundle: Bundle) -> Optional[str]:
+        if bundle.state is not None and bundle.state == bundle.calc_state():
+            return 'unchanged'
+        if self.state_cache and bundle.restore_state(
+            self.env['NODE_ENV'], self._work_dir(bundle.target_dir)
+        ):
+            return 'cached'
+        return None
+
+    def _work_dir(self, target_dir: str) -> str:
+        """Return directory for state, lock files and staged build output of
+        bundles in target directory. These are kept outside of static folder, so
+        they're never served.
         """
+        digest = hashlib.sha256(target_dir.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.work_dir, f'{os.path.basename(target_dir)}-{digest}')
+
+    def _open_lock_file(self, target_dir: str, bundle_name: Optional[str]) -> IO:
+        work_dir = self._work_dir(target_dir)
+        os.makedirs(work_dir, exist_ok=True)
+        name = 'group.lock'
+        if bundle_name:
+            name = f'bundle-{bundle_name}.lock'
+        return open(os.path.join(work_dir, name), 'a')
+
+    @contextmanager
+    def _process_lock(self, target_dir: str, bundle_name: Optional[str] = None):
+        """Hold exclusive lock on file in work directory, so only one process
+        builds bundle (or group of bundles sharing target directory) at a time.
+        Processes that waited for the lock can then reuse artifacts built by the
+        process that held it, using persisted bundle state.
+        """
+        if not self.process_lock:
+            yield
+            return
+        with self._open_lock_file(target_dir, bundle_name) as fp:
+            fcntl.flock(fp.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+
+    @asynccontextmanager
+    async def _async_process_lock(self, target_dir: str, bundle_name: str):
+        if not self.process_lock:
+            yield
+            return
+        fp = self._open_lock_file(target_dir, bundle_name)
+
+        def release():
+            fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+            fp.close()
+        await _acquire_in_thread(
+            functools.partial(fcntl.flock, fp.fileno(), fcntl.LOCK_EX), release
+        )
+        try:
+            yield
+        finally:
+            release()
+
+    def _build(self, bundle: Bundle, force: bool) -> bool:
+        new_state = bundle.calc_state()
+        environment = self.env['NODE_ENV']
+        if not force and self._fresh(bundle, new_state, environment):
+            return False
+        with self._process_lock(bundle.target_dir, bundle.name):
+            if not force and self._restore_state(bundle, environment):
+                return False
+            return self._run_build(bundle, new_state, environment)
+
+    def _fresh(self, bundle: Bundle, new_state: str, environment: str) -> bool:
+        if bundle.state == new_state:
+            if bundle.output is None:
+                self._resolve_output(bundle)
+            self._emit(build_skipped, bundle.name, reason='unchanged')
+            return True
+        return self._restore_state(bundle, environment)
+
+    def _restore_state(self, bundle: Bundle, environment: str) -> bool:
+        if not self.state_cache:
+            return False
+        if not bundle.restore_state(environment, self._work_dir(bundle.target_dir)):
+            return False
+        self._resolve_output(bundle)
+        self._emit(build_skipped, bundle.name, reason='cached')
+        return True
+
+    def _run_build(self, bundle: Bundle, new_state: str, environment: str) -> bool:
+        with self._begin_build(bundle) as build:
+            if build.meta is None:
+                with self._instrument(build, [bundle]):
+                    build.meta = self._execute(
+                        self.build_specs[bundle.name], build.staging_dir, [bundle]
+                    )
+        return self._finish_build(bundle, new_state, environment, build)
+
+    @contextmanager
+    def _staged_build(self, target_dir: str, bundles: List[Bundle]):
+        """Run build in staging directory and promote its output to target
+        directory once the build succeeded.
+        """
+        build = StagedBuild(self._staging_dir(target_dir), time.time_ns())
+        try:
+            yield build
+            # artifacts restored from build cache already have source maps
+            # relative to target directory
+            self._promote(
+                build.staging_dir, target_dir, bundles,
+                relocate=build.timing is not None,
+            )
+        finally:
+            self._remove_staging_dir(build.staging_dir, target_dir)
+
+    @contextmanager
+    def _begin_build(self, bundle: Bundle):
+        """Start build of single bundle, restoring its output from build cache if
+        possible. Rollup needs to be run only if build metadata is not set.
+        """
+        with self._staged_build(bundle.target_dir, [bundle]) as build:
+            if self.build_cache is not None:
+                build.meta = self._cache_restore(bundle, build.staging_dir)
+            yield build
+
+    @contextmanager
+    def _instrument(self, build: StagedBuild, bundles: List[Bundle]):
+        """Emit build signals around Rollup run and record its timing.
+        """
+        for bundle in bundles:
+            self._emit(build_started, bundle.name)
+        start = time.monotonic()
+        cpu_start = child_cpu_time()
+        try:
+            yield
+        except (Exception, asyncio.CancelledError) as e:
+            duration = time.monotonic() - start
+            for bundle in bundles:
+                self._emit(build_failed, bundle.name, error=e, duration=duration)
+            raise
+        build.timing = (time.monotonic() - start, child_cpu_time() - cpu_start)
+
+    def _finish_build(
+        self, bundle: Bundle, new_state: str, environment: str, build: StagedBuild
+    ) -> bool:
+        built = build.timing is not None
+        if bundle.apply_meta(build.meta):
+            new_state = bundle.calc_state()
+        artifacts = self._post_build(bundle, build.start_ns)
+        bundle.state = new_state
+        if built and self.build_cache is not None:
+            self._cache_store(bundle, build.meta, artifacts)
+        if self.observer is not None:
+            self._watch_inputs(bundle)
+        self._resolve_output(bundle)
+        if built:
+            self._build_finished(bundle, *build.timing)
+        else:
+            self._emit(build_skipped, bundle.name, reason='build-cache')
+        if self.state_cache:
+            bundle.save_state(environment, self._work_dir(bundle.target_dir))
+        return built
+
+    async def build(
+        self, bundle_name: str, force: bool = False, timeout: Optional[float] = None,
+        on_output: Optional[Callable[[str, str], Any]] = None,
+    ) -> bool:
+        """Asynchronous counterpart of :meth:`run_rollup`. Rollup is run as
+        asyncio subprocess, so event loop is free to do other work while bundle is
+        being built, and waiting for locks held by other builds happens in default
+        executor. Rollup output is captured line by line and passed to
+        ``on_output`` callable as it arrives. If the build times out or the
+        coroutine is cancelled, Rollup process is killed and previous bundle
+        output stays intact. In watch mode and with shared chunks enabled the
+        synchronous build is run in default executor, without timeout.
+
+        Args:
+            bundle_name: name of the bundle to be rebuilt
+            force: rebuild bundle regardless of its state
+            timeout: number of seconds after which Rollup process is killed,
+                     defaults to None (no timeout)
+            on_output: callable that receives bundle name and every line of
+                       Rollup output
+
+        Raises:
+            subprocess.CalledProcessError: if Rollup failed
+            subprocess.TimeoutExpired: if Rollup did not finish in time
+
+        Returns:
+            bool: ``True`` if Rollup has been run
+        """
+        bundle = self.resolve(bundle_name)
+        if self.watch or self.shared_chunks:
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self.run_rollup, bundle_name, force
+            )
+        lock = self._build_lock(bundle_name)
+        await _acquire_in_thread(lock.acquire, lock.release)
+        try:
+            return await self._async_build(bundle, force, timeout, on_output)
+        finally:
+            lock.release()
+
+    async def _async_build(
+        self, bundle: Bundle, force: bool, timeout: Optional[float],
+        on_output: Optional[Callable[[str, str], Any]],
+    ) -> bool:
+        new_state = bundle.calc_state()
+        environment = self.env['NODE_ENV']
+        if not force and self._fresh(bundle, new_state, environment):
+            return False
+        async with self._async_process_lock(bundle.target_dir, bundle.name):
+            if not force and self._restore_state(bundle, environment):
+                return False
+            with self._begin_build(bundle) as build:
+                if build.meta is None:
+                    with self._instrument(build, [bundle]):
+                        build.meta = await self._async_execute(
+                            self.build_specs[bundle.name], build.staging_dir,
+                            bundle.name, timeout, on_output,
+                        )
+            return self._finish_build(bundle, new_state, environment, build)
+
+    async def build_all(
+        self, names: Optional[Iterable[str]] = None, concurrency: int = 0,
+        force: bool = False, timeout: Optional[float] = None,
+        on_output: Optional[Callable[[str, str], Any]] = None,
+    ) -> List[BuildResult]:
+        """Asynchronous counterpart of :meth:`run_all`. Bundles are built with
+        :meth:`build`, with at most ``concurrency`` Rollup processes running at the
+        same time. Failure or timeout of any build does not stop the others,
+        instead it's recorded in build result of respective bundle. Cancelling the
+        coroutine cancels all builds that are in progress.
+
+        Args:
+            names: names of bundles to be built, defaults to all registered bundles
+            concurrency: number of concurrent builds, values lower than 1 (the
+                         default) mean number of available CPUs
+            force: rebuild bundles regardless of their state
+            timeout: timeout of every single build in seconds, defaults to None
+                     (no timeout)
+            on_output: callable that receives bundle name and every line of
+                       Rollup output
+
+        Returns:
+            List[BuildResult]: build results, in the same order as requested
+            bundle names
+        """
+        if names is None:
+            names = list(self.bundles.keys())
+        if concurrency < 1:
+            concurrency = os.cpu_count() or 1
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed_build(name: str) -> BuildResult:
+            async with semaphore:
+                start = time.monotonic()
+                try:
+                    built = await self.build(name, force, timeout, on_output)
+                except (OSError, subprocess.SubprocessError) as e:
+                    return BuildResult(name, False, time.monotonic() - start, e, False)
+                return BuildResult(name, True, time.monotonic() - start, None, built)
+        return list(await asyncio.gather(*(timed_build(name) for name in names)))
+
+    def rollup_version(self) -> str:
+        """Return version of Rollup, as reported by Rollup executable. Version is
+        part of build cache key.
+
+        Returns:
+            str: Rollup version, empty if it can't be determined
+        """
+        if self._rollup_version is None:
+            try:
+                rv = subprocess.run(
+                    [*self.launcher, '--version'], capture_output=True, text=True,
+                    check=True,
+                )
+                self._rollup_version = rv.stdout.strip()
+            except (OSError, subprocess.SubprocessError):
+                self._rollup_version = ''
+        return self._rollup_version
+
+    def _cache_key(self, bundle: Bundle, modules: Optional[List[str]]) -> str:
+        spec = self.build_specs[bundle.name]
+        # launcher and absolute paths differ between checkouts that may share
+        # the cache, configuration file path is relative to working directory
+        args = [
+            os.path.relpath(arg, spec.cwd) if arg == spec.config_path else arg
+            for arg in spec.command[len(self.launcher):]
+        ]
+        src = [
+            'index' if modules is None else 'build', spec.env['NODE_ENV'],
+            self.rollup_version(), ' '.join(args),
+        ]
+        try:
+            src.append(file_fingerprint(
+                spec.config_path or os.path.join(spec.cwd, self.config_path)
+            ))
+        except OSError:
+            src.append('')
+        paths = [ep.path for ep in bundle.entrypoints] + list(bundle.dependencies)
+        for path in dict.fromkeys(paths + list(modules or [])):
+            try:
+                fingerprint = file_fingerprint(path)
+            except OSError:
+                fingerprint = ''
+            src.append(f'{os.path.relpath(path, self.static_folder)}:{fingerprint}')
+        src.extend(ep.name for ep in bundle.entrypoints)
+        return hashlib.sha256('\n'.join(src).encode('utf-8')).hexdigest()
+
+    def _cache_restore(
+        self, bundle: Bundle, target_dir: str
+    ) -> Optional[Dict[str, Any]]:
+        index = self.build_cache.get(self._cache_key(bundle, None), target_dir)
+        if index is None:
+            return None
+        modules = [
+            resolve_path(self.static_folder, path) for path in index.get('modules', [])
+        ]
+        meta = self.build_cache.get(self._cache_key(bundle, modules), target_dir)
+        if meta is None:
+            return None
+        entries = meta.get('entries') or {}
+        for name, paths in entries.items():
+            entries[name] = [resolve_path(self.static_folder, path) for path in paths]
+        return meta
+
+    def _cache_store(
+        self, bundle: Bundle, meta: Dict[str, Any], artifacts: List[str]
+    ):
+        suffixes = tuple(COMPRESSED_SUFFIXES.values())
+        paths = [
+            path for path in artifacts
+            if not path.endswith(suffixes) and os.path.isfile(path)
+        ]
+        for path in bundle.chunks:
+            paths.extend(p for p in (path, f'{path}.map') if os.path.isfile(p))
+        entries = {
+            name: [
+                os.path.relpath(path, self.static_folder) for path in paths
+                if os.path.isabs(path)
+            ]
+            for name, paths in (meta.get('entries') or {}).items()
+        }
+        modules = [os.path.relpath(path, self.static_folder) for path in bundle.modules]
+        try:
+            self.build_cache.put(
+                self._cache_key(bundle, bundle.modules), paths,
+                dict(meta, entries=entries),
+            )
+            self.build_cache.put(
+                self._cache_key(bundle, None), [], {'modules': modules}
+            )
+        except OSError:
+            pass
+
+    def _build_finished(self, bundle: Bundle, duration: float, cpu_time: float):
+        paths = list(bundle.imports)
+        if bundle.output is not None:
+            paths.append(bundle.output.file_path)
+        output_size = sum(
+            os.stat(path).st_size for path in paths if os.path.isfile(path)
+        )
+        stats = BuildStats(duration, cpu_time, len(bundle.input_paths()), output_size)
+        self._emit(build_finished, bundle.name, stats=stats)
+
+    def _emit(self, signal, bundle_name: str, **kwargs):
+        with self._lock:
+            entry = self.stats.setdefault(bundle_name, {
+                'builds': 0, 'failures': 0, 'skips': 0, 'duration': 0.0,
+                'cpu_time': 0.0, 'last_duration': None, 'inputs': None,
+                'output_size': None,
+            })
+            if signal is build_finished:
+                stats = kwargs['stats']
+                entry['builds'] += 1
+                entry['duration'] += stats.duration
+                entry['cpu_time'] += stats.cpu_time
+                entry['last_duration'] = stats.duration
+                entry['inputs'] = stats.inputs
+                entry['output_size'] = stats.output_size
+            elif signal is build_failed:
+                entry['failures'] += 1
+                entry['duration'] += kwargs['duration']
+                self.failures[bundle_name] = kwargs['error']
+            elif signal is build_skipped:
+                entry['skips'] += 1
+            if signal is build_finished or signal is build_skipped:
+                self.failures.pop(bundle_name, None)
+        signal.send(self, bundle=bundle_name, **kwargs)
+
+    def stats_view(self):
+        """View function that returns build statistics of all bundles collected
+        by this process, as JSON or, with ``format=prometheus`` query param, in
+        Prometheus text exposition format.
+
+        Returns:
+            Response: statistics response
+        """
+        with self._lock:
+            stats = {name: dict(entry) for name, entry in self.stats.items()}
+        if request.args.get('format') != 'prometheus':
+            return jsonify(stats)
+        metrics = [
+            ('builds', 'counter', 'Number of bundle builds'),
+            ('failures', 'counter', 'Number of failed bundle builds'),
+            ('skips', 'counter', 'Number of skipped bundle builds'),
+            ('duration', 'counter', 'Total time spent building bundle in seconds'),
+            ('cpu_time', 'counter', 'Total CPU time of Rollup processes in seconds'),
+            ('last_duration', 'gauge', 'Duration of last bundle build in seconds'),
+            ('inputs', 'gauge', 'Number of bundle input files'),
+            ('output_size', 'gauge', 'Size of bundle output in bytes'),
+        ]
+        lines = []
+        for key, kind, description in metrics:
+            metric = f'flask_rollup_{key}'
+            if kind == 'counter':
+                metric = f'{metric}_total'
+            lines.append(f'# HELP {metric} {description}')
+            lines.append(f'# TYPE {metric} {kind}')
+            for name, entry in sorted(stats.items()):
+                if entry[key] is not None:
+                    lines.append(f'{metric}{{bundle="{name}"}} {entry[key]}')
+        return current_app.response_class(
+            '\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4'
+        )
+
+    def _staging_dir(self, target_dir: str) -> str:
+        """Create directory for build output in work directory, so artifacts can
+        be moved to target directory with atomic rename (provided both are on the
+        same file system). If target directory does not exist there's nothing to
+        be replaced, so Rollup writes directly there.
+        """
+        if not os.path.isdir(target_dir):
+            return target_dir
+        work_dir = self._work_dir(target_dir)
+        os.makedirs(work_dir, exist_ok=True)
+        return tempfile.mkdtemp(prefix='staging-', dir=work_dir)
+
+    def _remove_staging_dir(self, staging_dir: str, target_dir: str):
+        if staging_dir != target_dir:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def _promote(
+        self, staging_dir: str, target_dir: str, bundles: List[Bundle],
+        relocate: bool = True,
+    ):
+        """Move build output from staging directory to target directory. Chunks and
+        source maps are moved first, bundle files last, so by the time new bundle
+        file is visible everything it imports is already in place. Source paths
+        in source maps written by Rollup are relative to directory the map was
+        written to, so unless ``relocate`` is false they are rewritten to be
+        relative to target directory.
+        """
+        if staging_dir == target_dir:
+            return
+        prefixes = tuple(f'{bundle.name}.' for bundle in bundles)
+        names = sorted(
+            os.listdir(staging_dir),
+            key=lambda name: (name.startswith(prefixes), not name.endswith('.map')),
+        )
+        for name in names:
+            path = os.path.join(staging_dir, name)
+            if relocate and name.endswith('.map'):
+                relocate_source_map(path, staging_dir, target_dir)
+            replace_file(path, os.path.join(target_dir, name))
+
+    def _discard(self, paths: Iterable[str]):
+        """Remove superseded artifacts. With grace period configured, artifacts
+        are only scheduled for removal, so pages rendered before the rebuild can
+        still load them.
+        """
+        paths = list(paths)
+        if not paths:
+            return
+        if not self.gc_grace:
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            return
+        deadline = time.monotonic() + self.gc_grace
+        with self._lock:
+            for path in paths:
+                self._garbage.setdefault(path, deadline)
+        timer = threading.Timer(self.gc_grace, self.collect_garbage)
+        timer.daemon = True
+        timer.start()
+
+    def collect_garbage(self):
+        """Remove superseded artifacts which grace period has passed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                path for path, deadline in self._garbage.items() if deadline <= now
+            ]
+            for path in expired:
+                del self._garbage[path]
+        current = set()
+        for bundle in list(self.bundles.values()):
+            if bundle.output is not None:
+                current.add(bundle.output.file_path)
+            current.update(bundle.chunks)
+        for path in expired:
+            base = path
+            for suffix in (*COMPRESSED_SUFFIXES.values(), '.map'):
+                if base.endswith(suffix):
+                    base = base[:-len(suffix)]
+            if base in current:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _post_build(
+        self, bundle: Bundle, start_ns: Optional[int] = None
+    ) -> List[str]:
+        """Discard superseded artifacts and compress fresh ones. Artifacts written
+        by the build are recognised by modification time, with fallback to the
+        most recent ones on file systems with coarse timestamps.
+
+        Returns:
+            List[str]: paths of fresh artifacts
+        """
+        fresh = []
+        if start_ns is not None:
+            fresh = bundle.artifacts(since_ns=start_ns)
+        if not fresh:
+            fresh = bundle.latest_artifacts()
+        self._discard(bundle.stale_artifacts(keep=fresh))
+        with self._lock:
+            for path in fresh:
+                self._garbage.pop(path, None)
+        if self.compress:
+            bundle.compress_artifacts(self.compress)
+        return fresh
+
+    def rebuild(self, bundle_name: str):
+        """Rebuild bundle in development mode according to configured rebuild
+        policy. With ``block`` policy the request waits for the build to finish,
+        and concurrent requests for the same bundle wait for the same build instead
+        of starting new one. With ``stale`` policy previous bundle output is served
+        while bundle is rebuilt in background thread, unless there's no output at
+        all. With ``fail`` policy concurrent request for bundle that's being built
+        fails instead of waiting.
+
+        Checking bundle state may be throttled, either by checking it at most once
+        in configured interval, or only after file system events signalled change
+        to any of bundle inputs.
+
+        Args:
+            bundle_name: name of the bundle to be rebuilt
+
+        Raises:
+            BuildInProgressError: if the bundle is being built and policy is
+                                  ``fail``
+        """
+        if not self._check_due(bundle_name):
+            return
+        try:
+            self._rebuild(bundle_name)
+        except Exception:
+            if self.observer is not None:
+                with self._lock:
+                    self._dirty.add(bundle_name)
+            raise
+
+    def _check_due(self, bundle_name: str) -> bool:
+        if self.bundles[bundle_name].output is None:
+            return True
+        if self.observer is not None:
+            with self._lock:
+                if bundle_name not in self._dirty:
+                    return False
+                self._dirty.discard(bundle_name)
+            return True
+        if self.check_interval:
+            now = time.monotonic()
+            last = self._checked.get(bundle_name)
+            if last is not None and now - last < self.check_interval:
+                return False
+            self._checked[bundle_name] = now
+        return True
+
+    def invalidate(self, paths: Iterable[str]):
+        """Mark bundles that have any of specified paths as inputs as dirty, so
+        their state is checked on next request.
+
+        Args:
+            paths: changed file paths
+        """
+        paths = set(paths)
+        dirty = [
+            name for name, bundle in list(self.bundles.items())
+            if paths.intersection(bundle.input_paths())
+        ]
+        with self._lock:
+            self._dirty.update(dirty)
+
+    def _watch_inputs(self, bundle: Bundle):
+        handler = InputsEventHandler(self)
+        for directory in {os.path.dirname(path) for path in bundle.input_paths()}:
+            if (
+                not self.watch_node_modules
+                and 'node_modules' in directory.split(os.sep)
+            ):
+                continue
+            with self._lock:
+                if directory in self._watched_dirs or not os.path.isdir(directory):
+                    continue
+                self._watched_dirs.add(directory)
+            self.observer.schedule(handler, directory, recursive=False)
+
+    def _rebuild(self, bundle_name: str):
+        if self.rebuild_policy == 'block' or self.watch:
+            self.run_rollup(bundle_name)
+            return
         bundle = self.bundles[bundle_name]
+        if self._build_lock(bundle_name).locked():
+            if self.rebuild_policy == 'fail':
+                raise BuildInProgressError(f'Bundle {bundle_name} is being built')
+            if bundle.output is not None:
+                return
+        if self.rebuild_policy == 'fail' or bundle.output is None:
+            self.run_rollup(bundle_name)
+            return
+        if bundle.calc_state() == bundle.state:
+            return
+        with self._lock:
+            thread = self._background.get(bundle_name)
+            if thread is None or not thread.is_alive():
+                thread = threading.Thread(
+                    target=self.run_rollup, args=(bundle_name,), daemon=True
+                )
+                self._background[bundle_name] = thread
+                thread.start()
+
+    def _wait_for_watcher(self, bundle: Bundle):
+        with self._lock:
+            watcher = self.watchers.get(bundle.name)
+            if watcher is None or not watcher.running:
+                spec = self.build_specs[bundle.name]
+                watcher = RollupWatcher(spec.argv(), spec.env, spec.cwd)
+                watcher.start()
+                self.watchers[bundle.name] = watcher
         new_state = bundle.calc_state()
         if bundle.state != new_state:
-            bundle.clean_artifacts()
-            argv = self.argv.copy()
-            argv.extend(bundle.argv())
-            environ = os.environ.copy()
-            environ['NODE_ENV'] = environ.get('FLASK_ENV', 'production')
-            kw = {}
-            if not self.mode_production:
-                kw.update({
-                    'stdout': subprocess.DEVNULL,
-                    'stderr': subprocess.DEVNULL,
-                })
-            subprocess.run(argv, check=True, env=environ, **kw)
-            bundle.state = new_state
-        bundle.resolve_output(self.static_folder, self.static_url_path)
+            changed_ns = max((
+                os.stat(path).st_mtime_ns for path in bundle.input_paths()
+                if os.path.exists(path)
+            ), default=0)
+            if watcher.wait(changed_ns, self.watch_timeout):
+                if bundle.apply_meta(watcher.meta()):
+                    new_state = bundle.calc_state()
+                self._post_build(bundle)
+                bundle.state = new_state
+                self._resolve_output(bundle)
+                if self.state_cache:
+                    bundle.save_state(
+                        self.env['NODE_ENV'], self._work_dir(bundle.target_dir)
+                    )
+                return
+        self._resolve_output(bundle)
+
+    def stop_watchers(self):
+        """Terminate all Rollup processes running in watch mode.
+        """
+        with self._lock:
+            for watcher in self.watchers.values():
+                watcher.stop()
+            self.watchers.clear()
+
+    def _output_capture(self, bundle_names: List[str]) -> OutputCapture:
+        capture = OutputCapture(bundle_names, self.output_lines)
+        with self._lock:
+            for name in bundle_names:
+                self.build_output[name] = capture.records
+        return capture
+
+    @contextmanager
+    def _meta_env(self, spec: BuildSpec):
+        """Provide environment of Rollup process with path of temporary file the
+        meta plugin writes build metadata to.
+        """
+        environ = dict(spec.env)
+        fd, meta_path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        environ['FLASK_ROLLUP_META'] = meta_path
+        try:
+            yield environ, meta_path
+        finally:
+            os.remove(meta_path)
+
+    def _execute(
+        self, spec: BuildSpec, target_dir: str, bundles: List[Bundle]
+    ) -> Dict[str, Any]:
+        argv = spec.argv(target_dir)
+        capture = self._output_capture([bundle.name for bundle in bundles])
+        with self._meta_env(spec) as (environ, meta_path):
+            read_fd, write_fd = os.pipe()
+            reader = threading.Thread(
+                target=capture.read, args=(read_fd,), daemon=True
+            )
+            reader.start()
+            try:
+                try:
+                    subprocess.run(
+                        argv, check=True, env=environ, cwd=spec.cwd,
+                        stdout=write_fd, stderr=write_fd,
+                    )
+                finally:
+                    os.close(write_fd)
+                    reader.join()
+            except subprocess.CalledProcessError as e:
+                e.output = capture.text()
+                raise
+            return read_build_meta(meta_path)
+
+    async def _async_execute(
+        self, spec: BuildSpec, target_dir: str, bundle_name: str,
+        timeout: Optional[float], on_output: Optional[Callable[[str, str], Any]],
+    ) -> Dict[str, Any]:
+        argv = spec.argv(target_dir)
+        capture = self._output_capture([bundle_name])
+
+        def feed(line: bytes):
+            line = line.decode('utf-8', 'replace').rstrip('\r\n')
+            capture.feed(line)
+            if on_output is not None:
+                on_output(bundle_name, line)
+
+        async def communicate(process: asyncio.subprocess.Process) -> int:
+            pending = b''
+            while True:
+                chunk = await process.stdout.read(OUTPUT_CHUNK_SIZE)
+                lines, pending = split_output(pending, chunk)
+                for line in lines:
+                    feed(line)
+                if not chunk:
+                    return await process.wait()
+        with self._meta_env(spec) as (environ, meta_path):
+            process = await asyncio.create_subprocess_exec(
+                *argv, env=environ, cwd=spec.cwd, stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+            )
+            try:
+                returncode = await asyncio.wait_for(communicate(process), timeout)
+            except asyncio.TimeoutError:
+                await _kill(process)
+                raise subprocess.TimeoutExpired(
+                    argv, timeout, output=capture.text()
+                ) from None
+            except (OSError, subprocess.SubprocessError, asyncio.CancelledError):
+                await _kill(process)
+                raise
+            except Exception as e:
+                await _kill(process)
+                raise subprocess.SubprocessError(
+                    f'Failed to process Rollup output: {e}'
+                ) from e
+            if returncode:
+                raise subprocess.CalledProcessError(
+                    returncode, argv, output=capture.text()
+                )
+            return read_build_meta(meta_path)
+
+    def _timed_build(self, bundle_name: str, force: bool = False) -> BuildResult:
+        start = time.monotonic()
+        try:
+            built = self.run_rollup(bundle_name, force)
+        except (OSError, subprocess.SubprocessError) as e:
+            return BuildResult(bundle_name, False, time.monotonic() - start, e, False)
+        return BuildResult(bundle_name, True, time.monotonic() - start, None, built)
+
+    def run_all(
+        self, names: Optional[Iterable[str]] = None, jobs: int = 1,
+        force: bool = False,
+    ) -> List[BuildResult]:
+        """Build multiple bundles, possibly concurrently. Each bundle is built in
+        separate Rollup process, with at most ``jobs`` processes running at the same
+        time. Failure of any build does not stop the others, instead it's recorded
+        in build result of respective bundle.
+
+        Args:
+            names: names of bundles to be built, defaults to all registered bundles
+            jobs: number of concurrent builds, values lower than 1 mean number of
+                  available CPUs
+            force: rebuild bundles regardless of their state
+
+        Returns:
+            List[BuildResult]: build results (name, success, duration, error and
+            whether Rollup has been run), in the same order as requested bundle
+            names
+        """
+        if names is None:
+            names = list(self.bundles.keys())
+        else:
+            names = list(names)
+        if jobs < 1:
+            jobs = os.cpu_count() or 1
+        if jobs == 1 or len(names) < 2:
+            return [self._timed_build(name, force) for name in names]
+        with ThreadPoolExecutor(max_workers=min(jobs, len(names))) as executor:
+            return list(
+                executor.map(self._timed_build, names, [force] * len(names))
+            )
+
+    def batch_argv(self, target_dir: str, bundles: List[Bundle]) -> List[str]:
+        """Return full Rollup command line that builds all specified bundles in
+        single invocation. All bundles have to share the same target directory and
+        names of their entrypoints have to be unique.
+
+        Args:
+            target_dir: output directory of all bundles
+            bundles: list of bundles to be built together
+
+        Raises:
+            BundleDefinitionError: if entrypoint names clash
+
+        Returns:
+            List[str]: list of command line param tokens
+        """
+        return self._batch_spec(target_dir, bundles).argv()
+
+    def _batch_spec(self, target_dir: str, bundles: List[Bundle]) -> BuildSpec:
+        seen = set()
+        for bundle in bundles:
+            for ep in bundle.entrypoints:
+                if ep.name in seen:
+                    raise BundleDefinitionError(
+                        f'Entrypoint {ep.name} defined more than once in {target_dir}'
+                    )
+                seen.add(ep.name)
+        return self._build_spec(target_dir, bundles)
+
+    def _build_group(
+        self, target_dir: str, bundles: List[Bundle], force: bool = True
+    ) -> List[BuildResult]:
+        """Build bundles sharing target directory together, holding group lock so
+        it does not race with other processes building bundles in the same
+        directory. Unless forced, bundles are checked again once the lock is
+        acquired, as they may have been built in the meantime.
+        """
+        with self._process_lock(target_dir):
+            if not force:
+                reasons = [self._skip_reason(bundle) for bundle in bundles]
+                if all(reasons):
+                    for bundle, reason in zip(bundles, reasons):
+                        if bundle.output is None:
+                            self._resolve_output(bundle)
+                        self._emit(build_skipped, bundle.name, reason=reason)
+                    return [
+                        BuildResult(b.name, True, 0.0, None, False) for b in bundles
+                    ]
+            return self._run_group(target_dir, bundles)
+
+    def _run_group(self, target_dir: str, bundles: List[Bundle]) -> List[BuildResult]:
+        start = time.monotonic()
+        try:
+            states = [bundle.calc_state() for bundle in bundles]
+            spec = self._batch_spec(target_dir, bundles)
+            with self._staged_build(target_dir, bundles) as build:
+                with self._instrument(build, bundles):
+                    build.meta = self._execute(spec, build.staging_dir, bundles)
+        except (OSError, subprocess.SubprocessError) as e:
+            duration = time.monotonic() - start
+            return [BuildResult(b.name, False, duration, e, False) for b in bundles]
+        duration = time.monotonic() - start
+        cpu_time = build.timing[1]
+        environment = self.env['NODE_ENV']
+        previous_chunks = {path for bundle in bundles for path in bundle.chunks}
+        for bundle, state in zip(bundles, states):
+            if bundle.apply_meta(build.meta):
+                state = bundle.calc_state()
+            self._post_build(bundle, build.start_ns)
+            bundle.state = state
+            self._resolve_output(bundle)
+            if self.state_cache:
+                bundle.save_state(environment, self._work_dir(bundle.target_dir))
+            self._build_finished(bundle, duration, cpu_time)
+        self._remove_chunks(previous_chunks)
+        return [BuildResult(b.name, True, duration, None) for b in bundles]
+
+    def _remove_chunks(self, paths: Iterable[str]):
+        required = {path for bundle in self.bundles.values() for path in bundle.chunks}
+        for path in set(paths) - required:
+            self._discard(glob.glob(f'{glob.escape(path)}*'))
+
+    def run_batch(
+        self, names: Optional[Iterable[str]] = None, jobs: int = 1,
+        force: bool = True,
+    ) -> List[BuildResult]:
+        """Build multiple bundles with as few Rollup invocations as possible.
+        Bundles are grouped by target directory and each group is built by single
+        Rollup process with all entrypoints of all bundles in group as inputs. This
+        way the cost of starting Rollup and loading its configuration is paid once
+        per group and Rollup can extract code shared by bundles to common chunks.
+        Groups are independent so they may be built concurrently. Unless forced,
+        groups where state of all bundles is up to date (or can be restored from
+        persisted state) are not built.
+
+        Args:
+            names: names of bundles to be built, defaults to all registered bundles
+            jobs: number of concurrent builds, values lower than 1 mean number of
+                  available CPUs
+            force: rebuild bundles regardless of their state, defaults to True
+
+        Raises:
+            BundleDefinitionError: if entrypoint names clash within any group
+
+        Returns:
+            List[BuildResult]: build results, in the same order as requested
+            bundle names; all bundles in a group share the same result
+        """
+        if names is None:
+            names = list(self.bundles.keys())
+        else:
+            names = list(names)
+        groups = {}
+        for name in names:
+            bundle = self.resolve(name)
+            groups.setdefault(bundle.target_dir, []).append(bundle)
+        skipped = []
+        if not force:
+            for target_dir, bundles in list(groups.items()):
+                reasons = [self._skip_reason(bundle) for bundle in bundles]
+                if all(reasons):
+                    skipped.extend(zip(bundles, reasons))
+                    del groups[target_dir]
+        for bundle, reason in skipped:
+            if bundle.output is None:
+                self._resolve_output(bundle)
+            self._emit(build_skipped, bundle.name, reason=reason)
+        for target_dir, bundles in groups.items():
+            self.batch_argv(target_dir, bundles)
+        target_dirs = list(groups.keys())
+        bundle_groups = list(groups.values())
+        forced = [force] * len(target_dirs)
+        if jobs < 1:
+            jobs = os.cpu_count() or 1
+        if jobs == 1 or len(target_dirs) < 2:
+            group_results = map(
+                self._build_group, target_dirs, bundle_groups, forced
+            )
+        else:
+            with ThreadPoolExecutor(
+                max_workers=min(jobs, len(target_dirs))
+            ) as executor:
+                group_results = list(executor.map(
+                    self._build_group, target_dirs, bundle_groups, forced
+                ))
+        results = {r.name: r for group in group_results for r in group}
+        results.update(
+            (bundle.name, BuildResult(bundle.name, True, 0.0, None, False))
+            for bundle, _ in skipped
+        )
+        return [results[name] for name in names]
@@ -0,0 +1,143 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional
+
+
+class BuildCache(ABC):
+    """Interface of build cache backend. Build cache stores artifacts of bundle
+    builds (Javascript files, source maps and chunks) along with build metadata,
+    under key that is calculated from everything that affects build output. Cache
+    backends that keep entries in remote stores (eg. object storage shared by CI
+    runners) should implement this interface.
+    """
+
+    @abstractmethod
+    def get(self, key: str, target_dir: str) -> Optional[Dict[str, Any]]:
+        """Restore cached artifacts to target directory.
+
+        Args:
+            key: cache key
+            target_dir: directory to which artifacts should be restored
+
+        Returns:
+            Optional[Dict[str, Any]]: build metadata stored with artifacts, or
+            None if there's no entry with such key
+        """
+
+    @abstractmethod
+    def put(self, key: str, paths: Iterable[str], meta: Dict[str, Any]):
+        """Store build artifacts and metadata, replacing existing entry with the
+        same key.
+
+        Args:
+            key: cache key
+            paths: artifact file paths
+            meta: build metadata
+        """
+
+
+class LocalBuildCache(BuildCache):
+    """Build cache that keeps entries in local directory, one subdirectory per
+    entry. Entries are written to temporary directory first and then renamed, so
+    multiple processes may share the cache. If cache size limit is set, least
+    recently used entries are evicted once the total size of cached files
+    exceeds the limit.
+
+    Args:
+        path: cache directory
+        max_size: cache size limit in bytes, defaults to None (no limit)
+    """
+    META_FILE = 'meta.json'
+
+    def __init__(self, path: str, max_size: Optional[int] = None):
+        self.path = path
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, key: str, target_dir: str) -> Optional[Dict[str, Any]]:
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, self.META_FILE)) as fp:
+                meta = json.load(fp)
+            names = [name for name in os.listdir(entry_dir) if name != self.META_FILE]
+            os.makedirs(target_dir, exist_ok=True)
+            for name in names:
+                shutil.copyfile(
+                    os.path.join(entry_dir, name), os.path.join(target_dir, name)
+                )
+            os.utime(entry_dir)
+        except (OSError, ValueError):
+            return None
+        return meta
+
+    def put(self, key: str, paths: Iterable[str], meta: Dict[str, Any]):
+        entry_dir = self._entry_dir(key)
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(entry_dir), suffix='.tmp')
+        try:
+            for path in paths:
+                shutil.copyfile(path, os.path.join(tmp_dir, os.path.basename(path)))
+            with open(os.path.join(tmp_dir, self.META_FILE), 'w') as fp:
+                json.dump(meta, fp)
+            if os.path.isdir(entry_dir):
+                old_dir = tempfile.mkdtemp(
+                    dir=os.path.dirname(entry_dir), suffix='.tmp'
+                )
+                os.rename(entry_dir, os.path.join(old_dir, key))
+                shutil.rmtree(old_dir, ignore_errors=True)
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        if self.max_size is not None:
+            self.evict()
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Return information on all cache entries.
+
+        Returns:
+            List[Dict[str, Any]]: list of entries with path, size and time of last
+            use, least recently used first
+        """
+        if not os.path.isdir(self.path):
+            return []
+        rv = []
+        for prefix in os.listdir(self.path):
+            prefix_dir = os.path.join(self.path, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry_dir = os.path.join(prefix_dir, key)
+                if key.endswith('.tmp'):
+                    continue
+                try:
+                    size = sum(
+                        os.stat(os.path.join(entry_dir, name)).st_size
+                        for name in os.listdir(entry_dir)
+                    )
+                    used = os.stat(entry_dir).st_mtime_ns
+                except OSError:
+                    continue
+                rv.append({'path': entry_dir, 'size': size, 'used': used})
+        rv.sort(key=lambda entry: entry['used'])
+        return rv
+
+    def evict(self):
+        """Remove least recently used entries until total size of cache is within
+        configured limit.
+        """
+        with self._lock:
+            entries = self.entries()
+            total = sum(entry['size'] for entry in entries)
+            for entry in entries:
+                if total <= self.max_size:
+                    break
+                shutil.rmtree(entry['path'], ignore_errors=True)
+                total -= entry['size']
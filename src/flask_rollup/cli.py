@@ -1,10 +1,13 @@
 import shlex
 import subprocess
+import textwrap
 
 import click
 from flask import current_app
 from flask.cli import with_appcontext
 
+from . import BundleDefinitionError, read_json
+
 
 @click.group(name='rollup')
 def rollup_grp():  # pragma: no cover
@@ -24,9 +27,51 @@ def rollup_init_cmd(install_babel):
 
     rollup_config_plain = """import resolve from '@rollup/plugin-node-resolve';
 import commonjs from '@rollup/plugin-commonjs';
+import { writeFileSync } from 'fs';
 
 const isProduction = process.env.NODE_ENV === 'production';
 
+// writes module graph of entrypoints and generated chunks for Flask-Rollup
+const flaskRollupMeta = () => ({
+    name: 'flask-rollup-meta',
+    generateBundle(options, bundle) {
+        const metaPath = process.env.FLASK_ROLLUP_META;
+        if (!metaPath) {
+            return;
+        }
+        const entries = {};
+        const chunks = {};
+        for (const chunk of Object.values(bundle)) {
+            if (chunk.type !== 'chunk') {
+                continue;
+            }
+            chunks[chunk.fileName] = {
+                name: chunk.name,
+                isEntry: chunk.isEntry,
+                imports: chunk.imports,
+                dynamicImports: chunk.dynamicImports,
+            };
+            if (chunk.isEntry && chunk.facadeModuleId) {
+                const seen = new Set();
+                const queue = [chunk.facadeModuleId];
+                while (queue.length) {
+                    const id = queue.pop();
+                    if (seen.has(id)) {
+                        continue;
+                    }
+                    seen.add(id);
+                    const info = this.getModuleInfo(id);
+                    if (info) {
+                        queue.push(...info.importedIds, ...info.dynamicallyImportedIds);
+                    }
+                }
+                entries[chunk.name] = [...seen];
+            }
+        }
+        writeFileSync(metaPath, JSON.stringify({ entries, chunks }));
+    },
+});
+
 const terserOpts = {
     compress: {ecma: 2015, module: true},
     mangle: {module: true},
@@ -44,6 +89,7 @@ export default (async () => ({
     plugins: [
         resolve(),
         commonjs(),
+        flaskRollupMeta(),
         isProduction && (await import('rollup-plugin-terser')).terser(terserOpts),
     ]
 }))();
@@ -52,9 +98,51 @@ export default (async () => ({
     rollup_config_babel = """import resolve from '@rollup/plugin-node-resolve';
 import { babel } from '@rollup/plugin-babel';
 import commonjs from '@rollup/plugin-commonjs';
+import { writeFileSync } from 'fs';
 
 const isProduction = process.env.NODE_ENV === 'production';
 
+// writes module graph of entrypoints and generated chunks for Flask-Rollup
+const flaskRollupMeta = () => ({
+    name: 'flask-rollup-meta',
+    generateBundle(options, bundle) {
+        const metaPath = process.env.FLASK_ROLLUP_META;
+        if (!metaPath) {
+            return;
+        }
+        const entries = {};
+        const chunks = {};
+        for (const chunk of Object.values(bundle)) {
+            if (chunk.type !== 'chunk') {
+                continue;
+            }
+            chunks[chunk.fileName] = {
+                name: chunk.name,
+                isEntry: chunk.isEntry,
+                imports: chunk.imports,
+                dynamicImports: chunk.dynamicImports,
+            };
+            if (chunk.isEntry && chunk.facadeModuleId) {
+                const seen = new Set();
+                const queue = [chunk.facadeModuleId];
+                while (queue.length) {
+                    const id = queue.pop();
+                    if (seen.has(id)) {
+                        continue;
+                    }
+                    seen.add(id);
+                    const info = this.getModuleInfo(id);
+                    if (info) {
+                        queue.push(...info.importedIds, ...info.dynamicallyImportedIds);
+                    }
+                }
+                entries[chunk.name] = [...seen];
+            }
+        }
+        writeFileSync(metaPath, JSON.stringify({ entries, chunks }));
+    },
+});
+
 const terserOpts = {
     compress: {ecma: 2015, module: true},
     mangle: {module: true},
@@ -72,6 +160,7 @@ export default (async () => ({
     plugins: [
         resolve(),
         commonjs(),
+        flaskRollupMeta(),
         babel({ babelHelpers: 'bundled' })
         isProduction && (await import('rollup-plugin-terser')).terser(terserOpts),
     ]
@@ -125,10 +214,111 @@ export default (async () => ({
 
 @rollup_grp.command(name='run')
 @with_appcontext
-def rollup_run_cmd():
+@click.option(
+    '--jobs', '-j', type=int, default=1, show_default=True,
+    help='number of bundles built concurrently, 0 means number of CPUs',
+)
+@click.option(
+    '--batch', is_flag=True, default=False,
+    help='build bundles sharing target directory in single Rollup run',
+)
+@click.option(
+    '--incremental', is_flag=True, default=False,
+    help='build only bundles which inputs changed since last build',
+)
+def rollup_run_cmd(jobs, batch, incremental):
     """Run rollup and generate all registered bundles"""
     rollup = current_app.extensions['rollup']
-    for name in rollup.bundles.keys():
-        click.echo(f'Building bundle {name}')
-        rollup.run_rollup(name)
+    click.echo(f'Building {len(rollup.bundles)} bundle(s)')
+    if batch or rollup.shared_chunks:
+        try:
+            results = rollup.run_batch(jobs=jobs, force=not incremental)
+        except BundleDefinitionError as e:
+            raise click.ClickException(str(e)) from e
+    else:
+        results = rollup.run_all(jobs=jobs, force=not incremental)
+    failed = 0
+    for result in results:
+        if result.success and not result.built:
+            click.echo(f'Skipped bundle {result.name}, up to date')
+        elif result.success:
+            click.echo(f'Built bundle {result.name} in {result.duration:.2f}s')
+        else:
+            failed += 1
+            click.echo(
+                f'Failed to build bundle {result.name}: {result.error}', err=True
+            )
+            output = getattr(result.error, 'output', None)
+            if output:
+                click.echo(textwrap.indent(output, '    '), err=True)
+    if incremental:
+        built = len([result for result in results if result.built])
+        click.echo(
+            f'{built} bundle(s) built, '
+            f'{len(results) - built - failed} bundle(s) skipped'
+        )
+    if failed:
+        raise click.ClickException(f'{failed} bundle(s) failed to build')
+    previous = None
+    if rollup.manifest_path:
+        previous = read_json(rollup.manifest_path)
+    report = rollup.size_report(previous if isinstance(previous, dict) else None)
+    if rollup.manifest_path:
+        rollup.write_manifest()
+        click.echo(f'Manifest written to {rollup.manifest_path}')
+    over_budget = print_size_report(report)
+    if over_budget:
+        raise click.ClickException(
+            f'{len(over_budget)} bundle(s) over size budget: {", ".join(over_budget)}'
+        )
     click.echo('All done')
+
+
+def format_size(size, previous=None):
+    rv = f'{size / 1024:.1f} kB'
+    if previous is not None:
+        rv = f'{rv} ({(size - previous) / 1024:+.1f} kB)'
+    return rv
+
+
+def print_size_report(report):
+    """Print table of bundle sizes with changes since previous build and size
+    budgets.
+
+    Args:
+        report: list of bundle size reports
+
+    Returns:
+        List[str]: names of bundles that exceed their size budget
+    """
+    if not report:
+        return []
+    over_budget = []
+    rows = [('Bundle', 'Size', 'Gzipped', 'Budget')]
+    for item in report:
+        budgets = []
+        broken = False
+        for size, limit, label in [
+            (item.size, item.max_size, 'raw'),
+            (item.gzip_size, item.max_gzip_size, 'gzip'),
+        ]:
+            if limit is None:
+                continue
+            if size > limit:
+                broken = True
+                budgets.append(f'{label} > {format_size(limit)}')
+        if broken:
+            over_budget.append(item.name)
+        elif item.max_size is not None or item.max_gzip_size is not None:
+            budgets.append('ok')
+        rows.append((
+            item.name, format_size(item.size, item.previous_size),
+            format_size(item.gzip_size, item.previous_gzip_size),
+            ', '.join(budgets) or '-',
+        ))
+    widths = [max(len(row[col]) for row in rows) for col in range(len(rows[0]))]
+    for row in rows:
+        click.echo('  '.join(
+            value.ljust(width) for value, width in zip(row, widths)
+        ).rstrip())
+    return over_budget
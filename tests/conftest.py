@@ -3,5 +3,5 @@ from flask import Flask
 
 
 @pytest.fixture()
-def app():
-    return Flask('test')
+def app(tmp_path):
+    return Flask('test', instance_path=str(tmp_path / 'instance'))
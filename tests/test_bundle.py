@@ -1,9 +1,17 @@
+import base64
+import gzip
 import hashlib
+import json
+import multiprocessing
 import os
+import stat
 
 import pytest
 
-from flask_rollup import Bundle, BundleDefinitionError, Entrypoint
+from flask_rollup import (
+    FILE_MODE, Bundle, BundleDefinitionError, Entrypoint, file_fingerprint,
+    file_integrity, precompress,
+)
 
 
 def test_create_params():
@@ -61,17 +69,128 @@ def test_simple_entrypoints_limited(entrypoints):
         Bundle(name, target_dir, entrypoints)
 
 
-def test_calc_state(mocker):
-    mocker.patch(
-        'flask_rollup.os.stat', mocker.Mock(return_value=mocker.Mock(st_mtime_ns=100))
-    )
+def test_calc_state(tmp_path):
+    for name in ['file1.js', 'file2.js', 'file3.js']:
+        (tmp_path / name).write_text(f'// {name}')
     b = Bundle(
-        'p1', 'some/where', ['some/input/file1.js'],
-        dependencies=['some/input/file2.js', 'some/input/file3.js'],
+        'p1', 'some/where', ['file1.js'],
+        dependencies=['file2.js', 'file3.js'],
     )
-    b.resolve_paths('/static/directory')
+    b.resolve_paths(str(tmp_path))
     rv = b.calc_state()
-    assert rv == hashlib.sha256('\n'.join(['100'] * 3).encode('utf-8')).hexdigest()
+    assert len(rv) == 64
+    os.utime(tmp_path / 'file2.js', ns=(10 ** 9, 10 ** 9))
+    assert b.calc_state() == rv
+    (tmp_path / 'file2.js').write_text('// changed')
+    assert b.calc_state() != rv
+
+
+def test_file_fingerprint_cached(tmp_path, mocker):
+    path = tmp_path / 'file1.js'
+    path.write_text('// content')
+    rv = file_fingerprint(str(path))
+    assert rv == hashlib.sha256(b'// content').hexdigest()
+    fake_open = mocker.patch('builtins.open')
+    assert file_fingerprint(str(path)) == rv
+    fake_open.assert_not_called()
+
+
+def test_save_restore_state(tmp_path):
+    (tmp_path / 'file1.js').write_text('// entrypoint')
+    (tmp_path / 'file2.js').write_text('// module')
+    out_dir = tmp_path / 'some' / 'where'
+    out_dir.mkdir(parents=True)
+    out_file = out_dir / 'p1.abc123.js'
+    out_file.write_text('// bundle')
+    b = Bundle('p1', 'some/where', ['file1.js'])
+    b.resolve_paths(str(tmp_path))
+    b.modules = [str(tmp_path / 'file2.js')]
+    b.resolve_output(str(tmp_path), '/static')
+    b.state = b.calc_state()
+    b.save_state('production')
+    other = Bundle('p1', 'some/where', ['file1.js'])
+    other.resolve_paths(str(tmp_path))
+    assert other.restore_state('development') is False
+    assert other.restore_state('production') is True
+    assert other.state == b.state
+    assert other.modules == b.modules
+    (tmp_path / 'file2.js').write_text('// changed')
+    other.state = None
+    assert other.restore_state('production') is False
+    (tmp_path / 'file2.js').write_text('// module')
+    out_file.unlink()
+    assert other.restore_state('production') is False
+
+
+def test_save_restore_state_dir(tmp_path):
+    (tmp_path / 'file1.js').write_text('// entrypoint')
+    out_dir = tmp_path / 'dist'
+    out_dir.mkdir()
+    (out_dir / 'p1.abc123.js').write_text('// bundle')
+    state_dir = tmp_path / 'state'
+    b = Bundle('p1', 'dist', ['file1.js'])
+    b.resolve_paths(str(tmp_path))
+    b.resolve_output(str(tmp_path), '/static')
+    b.state = b.calc_state()
+    b.save_state('production', str(state_dir))
+    assert (state_dir / Bundle.STATE_FILE).is_file()
+    assert os.listdir(out_dir) == ['p1.abc123.js']
+    other = Bundle('p1', 'dist', ['file1.js'])
+    other.resolve_paths(str(tmp_path))
+    assert other.restore_state('production') is False
+    assert other.restore_state('production', str(state_dir)) is True
+
+
+def save_states(root, names):
+    for name in names:
+        b = Bundle(name, 'dist', ['file1.js'])
+        b.resolve_paths(root)
+        b.resolve_output(root, '/static')
+        b.state = b.calc_state()
+        b.save_state('production', os.path.join(root, 'state'))
+
+
+def test_save_state_processes(tmp_path):
+    (tmp_path / 'file1.js').write_text('// entrypoint')
+    out_dir = tmp_path / 'dist'
+    out_dir.mkdir()
+    names = [f'p{index}' for index in range(40)]
+    for name in names:
+        (out_dir / f'{name}.abc123.js').write_text('// bundle')
+    context = multiprocessing.get_context('fork')
+    processes = [
+        context.Process(target=save_states, args=(str(tmp_path), names[start::2]))
+        for start in range(2)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    data = json.loads((tmp_path / 'state' / Bundle.STATE_FILE).read_text())
+    assert sorted(data) == sorted(names)
+
+
+def test_apply_meta(tmp_path):
+    for name in ['file1.js', 'file2.js', 'file3.js']:
+        (tmp_path / name).write_text(f'// {name}')
+    b = Bundle('p1', 'some/where', ['file1.js'])
+    b.resolve_paths(str(tmp_path))
+    meta = {
+        'entries': {
+            'p1': [
+                str(tmp_path / 'file1.js'), str(tmp_path / 'file2.js'),
+                '\0commonjsHelpers.js', 'external-module',
+            ],
+            'p2': [str(tmp_path / 'file3.js')],
+        },
+    }
+    state = b.calc_state()
+    assert b.apply_meta(meta) is True
+    assert b.modules == [str(tmp_path / 'file1.js'), str(tmp_path / 'file2.js')]
+    assert b.apply_meta(meta) is False
+    assert b.apply_meta({}) is False
+    assert b.calc_state() != state
+    assert len(b.input_paths()) == 2
 
 
 def test_bundle_argv():
@@ -100,6 +219,44 @@ def test_resolve_output_ok(mocker):
     assert b.output.url == os.path.join(url_path, b.output.static_path)
 
 
+def test_resolve_output_integrity(tmp_path, mocker):
+    out_dir = tmp_path / 'some' / 'where'
+    out_dir.mkdir(parents=True)
+    out_file = out_dir / 'p1.abc123.js'
+    out_file.write_bytes(b'// bundle')
+    b = Bundle('p1', 'some/where', ['some/input/file1.js'])
+    b.resolve_paths(str(tmp_path))
+    b.resolve_output(str(tmp_path), '/static')
+    assert b.output.integrity is None
+    b.resolve_output(str(tmp_path), '/static', 'sha384')
+    digest = base64.b64encode(hashlib.sha384(b'// bundle').digest()).decode('ascii')
+    assert b.output.integrity == f'sha384-{digest}'
+    fake_open = mocker.patch('builtins.open', side_effect=AssertionError)
+    assert file_integrity(str(out_file), 'sha384') == b.output.integrity
+    fake_open.assert_not_called()
+
+
+def test_output_sizes(tmp_path):
+    out_dir = tmp_path / 'dist'
+    out_dir.mkdir()
+    out_file = out_dir / 'p1.abc123.js'
+    out_file.write_bytes(b'// bundle' * 100)
+    chunk_file = out_dir / 'chunk.def456.js'
+    chunk_file.write_bytes(b'// chunk')
+    b = Bundle('p1', 'dist', ['main.js'])
+    b.resolve_paths(str(tmp_path))
+    b.resolve_output(str(tmp_path), '/static')
+    b.imports = [str(chunk_file)]
+    size, gzipped = b.output_sizes()
+    assert size == 900 + 8
+    assert gzipped == (
+        len(gzip.compress(b'// bundle' * 100, compresslevel=9, mtime=0))
+        + len(gzip.compress(b'// chunk', compresslevel=9, mtime=0))
+    )
+    precompress(str(out_file), ['gzip'])
+    assert b.output_sizes() == (size, gzipped)
+
+
 def test_resolve_output_fail(mocker):
     tgt_paths = [
         '/static/directory/some/where/file1.js',
@@ -113,3 +270,90 @@ def test_resolve_output_fail(mocker):
     url_path = '/static'
     b.resolve_output('/static/directory', url_path)
     assert b.output is None
+
+
+def test_compress_artifacts(tmp_path):
+    out_dir = tmp_path / 'dist'
+    out_dir.mkdir()
+    (out_dir / 'p1.abc123.js').write_text('// bundle ' * 100)
+    (out_dir / 'p1.abc123.js.map').write_text('{}')
+    b = Bundle('p1', 'dist', ['main.js'])
+    b.resolve_paths(str(tmp_path))
+    rv = b.compress_artifacts(['gzip'])
+    assert sorted(rv) == [
+        str(out_dir / 'p1.abc123.js.gz'), str(out_dir / 'p1.abc123.js.map.gz'),
+    ]
+    content = gzip.decompress((out_dir / 'p1.abc123.js.gz').read_bytes())
+    assert content == (out_dir / 'p1.abc123.js').read_bytes()
+    assert stat.S_IMODE((out_dir / 'p1.abc123.js.gz').stat().st_mode) == FILE_MODE
+    assert b.compress_artifacts(['gzip']) == []
+
+
+def test_compress_artifacts_chunks(tmp_path):
+    out_dir = tmp_path / 'dist'
+    out_dir.mkdir()
+    (out_dir / 'p1.abc123.js').write_text('// bundle')
+    (out_dir / 'chunk-def456.js').write_text('// chunk')
+    (out_dir / 'chunk-def456.js.map').write_text('{}')
+    b = Bundle('p1', 'dist', ['main.js'])
+    b.resolve_paths(str(tmp_path))
+    b.chunks = [str(out_dir / 'chunk-def456.js')]
+    rv = b.compress_artifacts(['gzip'])
+    assert sorted(rv) == [
+        str(out_dir / 'chunk-def456.js.gz'), str(out_dir / 'chunk-def456.js.map.gz'),
+        str(out_dir / 'p1.abc123.js.gz'),
+    ]
+
+
+def test_compress_brotli(tmp_path):
+    brotli = pytest.importorskip('brotli')
+    path = tmp_path / 'p1.abc123.js'
+    path.write_text('// bundle ' * 100)
+    rv = precompress(str(path), ['br'])
+    assert rv == [f'{path}.br']
+    assert brotli.decompress((tmp_path / 'p1.abc123.js.br').read_bytes()) == (
+        path.read_bytes()
+    )
+
+
+def test_clean_artifacts_keeps_compressed(tmp_path):
+    out_dir = tmp_path / 'dist'
+    out_dir.mkdir()
+    names = [
+        'p1.old.js', 'p1.old.js.gz', 'p1.old.js.map', 'p1.old.js.map.gz',
+        'p1.new.js', 'p1.new.js.gz', 'p1.new.js.map', 'p1.new.js.map.gz',
+    ]
+    for name in names:
+        (out_dir / name).write_text('x')
+    b = Bundle('p1', 'dist', ['main.js'])
+    b.resolve_paths(str(tmp_path))
+    b.clean_artifacts(keep=[str(out_dir / n) for n in ['p1.new.js', 'p1.new.js.map']])
+    assert sorted(os.listdir(out_dir)) == [
+        'p1.new.js', 'p1.new.js.gz', 'p1.new.js.map', 'p1.new.js.map.gz',
+    ]
+
+
+def test_apply_meta_chunk_imports():
+    b = Bundle('p1', 'dist', ['main.js'])
+    b.resolve_paths('/static/directory')
+    meta = {
+        'chunks': {
+            'p1.abc.js': {
+                'name': 'p1', 'isEntry': True,
+                'imports': ['shared-1.js'], 'dynamicImports': ['lazy-1.js'],
+            },
+            'shared-1.js': {
+                'name': 'shared', 'isEntry': False, 'imports': ['lib-1.js'],
+            },
+            'lib-1.js': {'name': 'lib', 'isEntry': False, 'imports': []},
+            'lazy-1.js': {'name': 'lazy', 'isEntry': False, 'imports': []},
+            'p2.def.js': {'name': 'p2', 'isEntry': True, 'imports': ['other-1.js']},
+        },
+    }
+    b.apply_meta(meta)
+    assert b.imports == [
+        '/static/directory/dist/shared-1.js', '/static/directory/dist/lib-1.js',
+    ]
+    assert b.import_urls('/static/directory', '/static') == [
+        '/static/dist/shared-1.js', '/static/dist/lib-1.js',
+    ]
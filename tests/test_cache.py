@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from flask_rollup import BuildCache, LocalBuildCache
+
+
+def test_incomplete_backend():
+    class RemoteCache(BuildCache):
+        def get(self, key, target_dir):
+            return None
+    with pytest.raises(TypeError):
+        RemoteCache()
+
+
+def test_put_get(tmp_path):
+    src_dir = tmp_path / 'src'
+    src_dir.mkdir()
+    (src_dir / 'p1.abc123.js').write_text('// bundle')
+    (src_dir / 'p1.abc123.js.map').write_text('{}')
+    cache = LocalBuildCache(str(tmp_path / 'cache'))
+    assert cache.get('abcdef', str(tmp_path / 'dist')) is None
+    cache.put(
+        'abcdef', [str(src_dir / 'p1.abc123.js'), str(src_dir / 'p1.abc123.js.map')],
+        {'entries': {'p1': ['main.js']}},
+    )
+    target_dir = tmp_path / 'dist'
+    meta = cache.get('abcdef', str(target_dir))
+    assert meta == {'entries': {'p1': ['main.js']}}
+    assert sorted(os.listdir(target_dir)) == ['p1.abc123.js', 'p1.abc123.js.map']
+    assert (target_dir / 'p1.abc123.js').read_text() == '// bundle'
+
+
+def test_put_replaces(tmp_path):
+    cache = LocalBuildCache(str(tmp_path / 'cache'))
+    cache.put('abcdef', [], {'modules': ['a.js']})
+    cache.put('abcdef', [], {'modules': ['b.js']})
+    assert cache.get('abcdef', str(tmp_path / 'dist')) == {'modules': ['b.js']}
+    assert len(cache.entries()) == 1
+
+
+def test_evict_least_recently_used(tmp_path):
+    src = tmp_path / 'p1.abc123.js'
+    src.write_text('x' * 1000)
+    cache = LocalBuildCache(str(tmp_path / 'cache'), max_size=3500)
+    for index, key in enumerate(['aa01', 'bb02', 'cc03']):
+        cache.put(key, [str(src)], {})
+        entry_dir = tmp_path / 'cache' / key[:2] / key
+        os.utime(entry_dir, ns=(index * 10 ** 9, index * 10 ** 9))
+    assert cache.get('aa01', str(tmp_path / 'dist')) is not None
+    cache.put('dd04', [str(src)], {})
+    assert cache.get('bb02', str(tmp_path / 'dist')) is None
+    assert cache.get('aa01', str(tmp_path / 'dist')) is not None
+    assert cache.get('dd04', str(tmp_path / 'dist')) is not None
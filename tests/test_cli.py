@@ -1,6 +1,8 @@
+import json
 import os
+import subprocess
 
-from flask_rollup import Bundle, Rollup
+from flask_rollup import BuildResult, Bundle, Entrypoint, Rollup
 from flask_rollup.cli import rollup_init_cmd, rollup_run_cmd
 
 
@@ -40,8 +42,116 @@ def test_run_command(app, mocker):
     rollup.register(b)
     fake_run = mocker.Mock()
     mocker.patch.object(rollup, 'run_rollup', fake_run)
+    fake_manifest = mocker.patch.object(rollup, 'write_manifest')
     runner = app.test_cli_runner()
     rv = runner.invoke(rollup_run_cmd)
     assert rv.exit_code == 0
     assert 'All done' in rv.output
     fake_run.assert_called_once()
+    fake_manifest.assert_called_once()
+
+
+def test_run_command_jobs(app, mocker):
+    rollup = Rollup(app)
+    for name in ['p1', 'p2', 'p3']:
+        rollup.register(Bundle(name, 'some/where', [f'some/input/{name}.js']))
+    fake_run = mocker.Mock()
+    mocker.patch.object(rollup, 'run_rollup', fake_run)
+    mocker.patch.object(rollup, 'write_manifest')
+    runner = app.test_cli_runner()
+    rv = runner.invoke(rollup_run_cmd, ['--jobs', '2'])
+    assert rv.exit_code == 0
+    assert fake_run.call_count == 3
+
+
+def test_run_command_failure(app, mocker):
+    rollup = Rollup(app)
+    for name in ['p1', 'p2']:
+        rollup.register(Bundle(name, 'some/where', [f'some/input/{name}.js']))
+    fake_run = mocker.Mock(
+        side_effect=[
+            None,
+            subprocess.CalledProcessError(1, ['rollup'], output='[!] Error: boom'),
+        ]
+    )
+    mocker.patch.object(rollup, 'run_rollup', fake_run)
+    fake_manifest = mocker.patch.object(rollup, 'write_manifest')
+    runner = app.test_cli_runner()
+    rv = runner.invoke(rollup_run_cmd)
+    assert rv.exit_code != 0
+    assert 'Failed to build bundle p2' in rv.output
+    assert '    [!] Error: boom' in rv.output
+    assert fake_run.call_count == 2
+    fake_manifest.assert_not_called()
+
+
+def test_run_command_batch(app, mocker):
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'some/where', ['some/input/p1.js']))
+    fake_run = mocker.Mock(return_value=[BuildResult('p1', True, 0.1, None)])
+    mocker.patch.object(rollup, 'run_batch', fake_run)
+    mocker.patch.object(rollup, 'write_manifest')
+    runner = app.test_cli_runner()
+    rv = runner.invoke(rollup_run_cmd, ['--batch'])
+    assert rv.exit_code == 0
+    fake_run.assert_called_once()
+
+
+def test_run_command_batch_definition_error(app, tmp_path):
+    app.static_folder = str(tmp_path)
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'dist', [Entrypoint('p1.js', 'main')]))
+    rollup.register(Bundle('p2', 'dist', [Entrypoint('p2.js', 'main')]))
+    runner = app.test_cli_runner()
+    rv = runner.invoke(rollup_run_cmd, ['--batch'])
+    assert rv.exit_code == 1
+    assert 'Error: Entrypoint main defined more than once' in rv.output
+    assert 'Traceback' not in rv.output
+
+
+def test_run_command_size_budget(app, mocker, tmp_path):
+    app.static_folder = str(tmp_path)
+    app.config['ROLLUP_MAX_GZIP_SIZE'] = 10000
+    out_dir = tmp_path / 'dist'
+    out_dir.mkdir()
+    (out_dir / 'p1.abc123.js').write_text('// bundle' * 1000)
+    (out_dir / 'p2.abc123.js').write_text('// bundle')
+    (tmp_path / 'rollup-manifest.json').write_text(
+        json.dumps({'p1': {
+            'file': 'dist/p1.abc123.js', 'total_size': 1024, 'total_gzip_size': 100,
+        }})
+    )
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'dist', ['p1.js'], max_size=2048))
+    rollup.register(Bundle('p2', 'dist', ['p2.js']))
+    mocker.patch.object(rollup, 'run_rollup')
+    runner = app.test_cli_runner()
+    rv = runner.invoke(rollup_run_cmd)
+    assert rv.exit_code != 0
+    assert '1 bundle(s) over size budget: p1' in rv.output
+    lines = rv.output.splitlines()
+    p1_line = next(line for line in lines if line.startswith('p1'))
+    assert '8.8 kB (+7.8 kB)' in p1_line
+    assert 'raw > 2.0 kB' in p1_line
+    p2_line = next(line for line in lines if line.startswith('p2'))
+    assert p2_line.endswith('ok')
+    manifest = json.loads((tmp_path / 'rollup-manifest.json').read_text())
+    assert manifest['p1']['total_size'] == 9000
+
+
+def test_run_command_incremental(app, mocker):
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'some/where', ['some/input/p1.js']))
+    rollup.register(Bundle('p2', 'some/where', ['some/input/p2.js']))
+    fake_run = mocker.patch.object(rollup, 'run_all', return_value=[
+        BuildResult('p1', True, 0.1, None, False),
+        BuildResult('p2', True, 0.1, None, True),
+    ])
+    mocker.patch.object(rollup, 'write_manifest')
+    runner = app.test_cli_runner()
+    rv = runner.invoke(rollup_run_cmd, ['--incremental'])
+    assert rv.exit_code == 0
+    fake_run.assert_called_once_with(jobs=1, force=False)
+    assert 'Skipped bundle p1' in rv.output
+    assert 'Built bundle p2' in rv.output
+    assert '1 bundle(s) built, 1 bundle(s) skipped' in rv.output
@@ -1,9 +1,25 @@
+import asyncio
+import errno
+import fcntl
+import glob
+import json
+import logging
 import os
+import stat
+import subprocess
+import sys
+import threading
+import time
 
 import pytest
-from flask import render_template_string, url_for
+from flask import Flask, render_template_string, url_for
 
-from flask_rollup import Bundle, Rollup
+from flask_rollup import (
+    FILE_MODE, OUTPUT_CHUNK_SIZE, BuildInProgressError, Bundle, BundleDefinitionError,
+    BundleOutput, Entrypoint, InputsEventHandler, OutputCapture, Rollup,
+    RollupBundlerError, build_failed, build_finished, build_skipped, build_started,
+    parse_output_line, replace_file, resolve_launcher,
+)
 
 
 def test_create_simple(app):
@@ -27,6 +43,70 @@ def test_config_path_provided(app):
     assert rv.argv[-1] == config_file_path
 
 
+def test_config_path_default(app, tmp_path):
+    app.static_folder = str(tmp_path)
+    rv = Rollup(app)
+    assert rv.argv == ['rollup', '-c']
+    rv.register(Bundle('p1', 'dist', ['p1.js']))
+    spec = rv.build_specs['p1']
+    assert spec.config_path is None
+    assert spec.argv()[:3] == ['rollup', '-c', '-d']
+
+
+def test_build_spec(app, mocker, tmp_path):
+    mocker.patch.dict('os.environ', {'FLASK_ENV': 'production'})
+    app.config['ROLLUP_CONFIG_JS'] = 'rollup.config.js'
+    app.static_folder = str(tmp_path)
+    (tmp_path / 'p1.js').write_text('// p1')
+    fake_run = mocker.patch(
+        'flask_rollup.subprocess.run', side_effect=fake_rollup_run
+    )
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'dist', ['p1.js']))
+    rollup.register(Bundle('p2', 'dist', ['p2.js']))
+    spec = rollup.build_specs['p1']
+    config_path = os.path.join(os.getcwd(), 'rollup.config.js')
+    assert spec.config_path == config_path
+    assert spec.argv() == [
+        'rollup', '-c', config_path, '-d', str(tmp_path / 'dist'),
+        f'p1={tmp_path / "p1.js"}',
+    ]
+    assert spec.env is rollup.build_specs['p2'].env
+    assert spec.env['NODE_ENV'] == 'production'
+    rollup.run_rollup('p1')
+    kwargs = fake_run.call_args[1]
+    assert kwargs['cwd'] == os.getcwd()
+    assert kwargs['env']['NODE_ENV'] == 'production'
+    assert 'FLASK_ROLLUP_META' not in spec.env
+
+
+def test_fast_launcher(app, tmp_path):
+    node = tmp_path / 'bin' / 'node'
+    node.parent.mkdir()
+    node.write_text('#!/bin/sh\n')
+    node.chmod(0o755)
+    bin_script = tmp_path / 'node_modules' / 'rollup' / 'dist' / 'bin' / 'rollup'
+    bin_script.parent.mkdir(parents=True)
+    bin_script.write_text('#!/usr/bin/env node\n')
+    bin_script.chmod(0o755)
+    shim = tmp_path / 'node_modules' / '.bin' / 'rollup'
+    shim.parent.mkdir()
+    shim.symlink_to(os.path.join('..', 'rollup', 'dist', 'bin', 'rollup'))
+    app.config['ROLLUP_PATH'] = str(shim)
+    app.config['ROLLUP_NODE'] = str(node)
+    rollup = Rollup(app)
+    assert rollup.launcher == [str(node), str(bin_script)]
+    rollup.register(Bundle('p1', 'dist', ['p1.js']))
+    assert rollup.build_specs['p1'].argv()[:3] == [str(node), str(bin_script), '-c']
+    shim.unlink()
+    shim.write_text('#!/bin/sh\nexec node "$basedir/../rollup/dist/bin/rollup"\n')
+    shim.chmod(0o755)
+    assert resolve_launcher(str(shim), str(node)) == [str(node), str(bin_script)]
+    bin_script.unlink()
+    assert resolve_launcher(str(shim), str(node)) == [str(shim)]
+    assert resolve_launcher('no-such-rollup', str(node)) == ['no-such-rollup']
+
+
 def test_autobuild_enabled_in_development(app, mocker):
     mocker.patch.dict('os.environ', {'FLASK_ENV': 'development'})
     Rollup(app)
@@ -41,9 +121,7 @@ def test_autobuild_running_in_development(app, mocker):
     mocker.patch.dict('os.environ', {'FLASK_ENV': 'development'})
     rollup = Rollup(app)
     b = Bundle(name, 'some/where', ['some/input/file.js'])
-    mocker.patch(
-        'flask_rollup.os.stat', mocker.Mock(return_value=mocker.Mock(st_mtime_ns=200))
-    )
+    mocker.patch('flask_rollup.file_fingerprint', mocker.Mock(return_value='fp'))
     mocker.patch('flask_rollup.subprocess.run')
     rollup.register(b)
     app.add_url_rule('/something', endpoint=name, view_func=handler)
@@ -65,9 +143,7 @@ def test_autobuild_skipped_for_other_endpoint(app, mocker):
     mocker.patch.dict('os.environ', {'FLASK_ENV': 'development'})
     rollup = Rollup(app)
     b = Bundle(name, 'some/where', ['some/input/file.js'])
-    mocker.patch(
-        'flask_rollup.os.stat', mocker.Mock(return_value=mocker.Mock(st_mtime_ns=200))
-    )
+    mocker.patch('flask_rollup.file_fingerprint', mocker.Mock(return_value='fp'))
     mocker.patch('flask_rollup.subprocess.run')
     rollup.register(b)
     app.add_url_rule('/something', endpoint=name, view_func=handler)
@@ -122,9 +198,7 @@ def test_run(environment, app, mocker):
     rollup = Rollup(app)
     fake_run = mocker.Mock()
     mocker.patch('flask_rollup.subprocess.run', fake_run)
-    mocker.patch(
-        'flask_rollup.os.stat', mocker.Mock(return_value=mocker.Mock(st_mtime_ns=100))
-    )
+    mocker.patch('flask_rollup.file_fingerprint', mocker.Mock(return_value='fp'))
     rollup.register(b)
     rollup.run_rollup(name)
     rollup.run_rollup(name)
@@ -173,3 +247,1086 @@ def test_template_global_fail_on_prod(app, mocker):
             url = url_for(name)
         rv = client.get(url)
         assert rv.status_code == 500
+
+
+@pytest.mark.parametrize('jobs', [1, 4])
+def test_run_all(jobs, app, mocker):
+    names = ['p1', 'p2', 'p3']
+    rollup = Rollup(app)
+    for name in names:
+        rollup.register(Bundle(name, 'some/where', [f'some/input/{name}.js']))
+
+    def fake_build(name, force=False):
+        if name == 'p2':
+            raise FileNotFoundError(name)
+    fake_run = mocker.Mock(side_effect=fake_build)
+    mocker.patch.object(rollup, 'run_rollup', fake_run)
+    rv = rollup.run_all(jobs=jobs)
+    assert [r.name for r in rv] == names
+    assert [r.success for r in rv] == [True, False, True]
+    assert isinstance(rv[1].error, OSError)
+
+
+def test_run_batch(app, mocker):
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'some/where', ['some/input/p1.js']))
+    rollup.register(Bundle('p2', 'some/where', ['some/input/p2.js']))
+    rollup.register(Bundle('p3', 'other/place', ['some/input/p3.js']))
+    mocker.patch('flask_rollup.file_fingerprint', mocker.Mock(return_value='fp'))
+    fake_run = mocker.Mock()
+    mocker.patch('flask_rollup.subprocess.run', fake_run)
+    rv = rollup.run_batch()
+    assert [r.name for r in rv] == ['p1', 'p2', 'p3']
+    assert all(r.success for r in rv)
+    assert fake_run.call_count == 2
+    argv = fake_run.call_args_list[0][0][0]
+    assert 'p1=' + rollup.bundles['p1'].entrypoints[0].path in argv
+    assert 'p2=' + rollup.bundles['p2'].entrypoints[0].path in argv
+    assert rollup.bundles['p1'].state is not None
+
+
+def test_run_batch_entrypoint_clash(app):
+    rollup = Rollup(app)
+    rollup.register(Bundle(
+        'p1', 'some/where', ['some/input/p1.js', Entrypoint('some/input/x.js', 'x')]
+    ))
+    rollup.register(Bundle(
+        'p2', 'some/where', ['some/input/p2.js', Entrypoint('some/input/y.js', 'x')]
+    ))
+    with pytest.raises(BundleDefinitionError):
+        rollup.run_batch()
+
+
+def test_run_reuses_persisted_state(app, mocker):
+    name = 'p1'
+    b = Bundle(name, 'some/where', ['some/input/file.js'])
+    rollup = Rollup(app)
+    mocker.patch('flask_rollup.file_fingerprint', mocker.Mock(return_value='fp'))
+    fake_restore = mocker.patch.object(b, 'restore_state', return_value=True)
+    fake_run = mocker.Mock()
+    mocker.patch('flask_rollup.subprocess.run', fake_run)
+    rollup.register(b)
+    assert rollup.run_rollup(name) is False
+    fake_run.assert_not_called()
+    fake_restore.assert_called_once()
+    assert rollup.run_rollup(name, force=True) is True
+    fake_run.assert_called_once()
+
+
+def fake_rollup_run(argv, **kwargs):
+    target_dir = argv[argv.index('-d') + 1]
+    os.makedirs(target_dir, exist_ok=True)
+    for param in argv:
+        if '=' in param:
+            name, path = param.split('=', 1)
+            with open(path) as fp:
+                content = fp.read()
+            with open(os.path.join(target_dir, f'{name}.{len(content)}.js'), 'w') as fp:
+                fp.write(content)
+
+
+@pytest.mark.parametrize('batch', [False, True])
+def test_run_incremental(batch, app, mocker, tmp_path):
+    app.static_folder = str(tmp_path)
+    (tmp_path / 'p1.js').write_text('// p1')
+    (tmp_path / 'p2.js').write_text('// p2')
+    fake_run = mocker.patch(
+        'flask_rollup.subprocess.run', side_effect=fake_rollup_run
+    )
+
+    def make_rollup():
+        rollup = Rollup(Flask(
+            'other', static_folder=str(tmp_path), instance_path=app.instance_path
+        ))
+        rollup.register(Bundle('p1', 'dist1', ['p1.js']))
+        rollup.register(Bundle('p2', 'dist2', ['p2.js']))
+        return rollup
+
+    def run(rollup):
+        if batch:
+            return rollup.run_batch(force=False)
+        return rollup.run_all(force=False)
+    rv = run(make_rollup())
+    assert fake_run.call_count == 2
+    assert [r.built for r in rv] == [True, True]
+    rollup = make_rollup()
+    rv = run(rollup)
+    assert fake_run.call_count == 2
+    assert [r.built for r in rv] == [False, False]
+    assert all(r.success for r in rv)
+    assert rollup.bundles['p1'].output.static_path == 'dist1/p1.5.js'
+    (tmp_path / 'p2.js').write_text('// p2 changed')
+    rv = run(make_rollup())
+    assert fake_run.call_count == 3
+    assert [r.built for r in rv] == [False, True]
+
+
+def test_run_staging(app, mocker, tmp_path):
+    app.static_folder = str(tmp_path)
+    (tmp_path / 'p1.js').write_text('// p1')
+    fake_run = mocker.patch(
+        'flask_rollup.subprocess.run', side_effect=fake_rollup_run
+    )
+    rollup = Rollup(app)
+    b = Bundle('p1', 'dist', ['p1.js'])
+    rollup.register(b)
+    rollup.run_rollup('p1')
+    assert fake_run.call_args[0][0][-2] == str(tmp_path / 'dist')
+    (tmp_path / 'p1.js').write_text('// p1 changed')
+    rollup.run_rollup('p1')
+    staging_dir = fake_run.call_args[0][0][-2]
+    work_dir = os.path.dirname(staging_dir)
+    assert os.path.dirname(work_dir) == os.path.join(app.instance_path, 'flask-rollup')
+    assert os.path.basename(staging_dir).startswith('staging-')
+    assert os.listdir(tmp_path / 'dist') == ['p1.13.js']
+    assert sorted(os.listdir(work_dir)) == [
+        '.flask-rollup-state.json', '.flask-rollup-state.json.lock',
+    ]
+    assert b.output.static_path == 'dist/p1.13.js'
+    (tmp_path / 'p1.js').write_text('// p1 failing')
+    fake_run.side_effect = subprocess.CalledProcessError(1, ['rollup'])
+    with pytest.raises(subprocess.CalledProcessError):
+        rollup.run_rollup('p1')
+    assert os.listdir(tmp_path / 'dist') == ['p1.13.js']
+    assert sorted(os.listdir(work_dir)) == [
+        '.flask-rollup-state.json', '.flask-rollup-state.json.lock',
+    ]
+
+
+def test_run_staging_source_maps(app, mocker, tmp_path):
+    app.static_folder = str(tmp_path)
+    (tmp_path / 'p1.js').write_text('// p1')
+
+    def fake_rollup(argv, **kwargs):
+        fake_rollup_run(argv)
+        target_dir = argv[argv.index('-d') + 1]
+        source = os.path.relpath(str(tmp_path / 'p1.js'), target_dir)
+        size = len((tmp_path / 'p1.js').read_text())
+        with open(os.path.join(target_dir, f'p1.{size}.js.map'), 'w') as fp:
+            json.dump({'sources': [source, 'webpack://x.js'], 'mappings': ''}, fp)
+    fake_run = mocker.patch('flask_rollup.subprocess.run', side_effect=fake_rollup)
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'dist', ['p1.js']))
+    rollup.run_rollup('p1')
+    (tmp_path / 'p1.js').write_text('// p1 changed')
+    rollup.run_rollup('p1')
+    assert fake_run.call_args[0][0][-2] != str(tmp_path / 'dist')
+    data = json.loads((tmp_path / 'dist' / 'p1.13.js.map').read_text())
+    assert data['sources'] == ['../p1.js', 'webpack://x.js']
+    mode = stat.S_IMODE((tmp_path / 'dist' / 'p1.13.js.map').stat().st_mode)
+    assert mode == FILE_MODE
+
+
+def test_run_build_cache_source_maps(app, mocker, tmp_path):
+    static_dir = tmp_path / 'static'
+    static_dir.mkdir()
+    (static_dir / 'p1.js').write_text('// p1')
+    app.static_folder = str(static_dir)
+    app.config['ROLLUP_BUILD_CACHE'] = str(tmp_path / 'cache')
+    app.config['ROLLUP_STATE_CACHE'] = False
+    mocker.patch.object(Rollup, 'rollup_version', return_value='2.0.0')
+
+    def fake_rollup(argv, **kwargs):
+        fake_rollup_run(argv)
+        target_dir = argv[argv.index('-d') + 1]
+        source = os.path.relpath(str(static_dir / 'p1.js'), target_dir)
+        size = len((static_dir / 'p1.js').read_text())
+        with open(os.path.join(target_dir, f'p1.{size}.js.map'), 'w') as fp:
+            json.dump({'sources': [source], 'mappings': ''}, fp)
+    fake_run = mocker.patch('flask_rollup.subprocess.run', side_effect=fake_rollup)
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'dist', ['p1.js']))
+    for content in ['// p1', '// p1 changed', '// p1']:
+        (static_dir / 'p1.js').write_text(content)
+        rollup.run_rollup('p1', force=True)
+        map_path = static_dir / 'dist' / f'p1.{len(content)}.js.map'
+        assert json.loads(map_path.read_text())['sources'] == ['../p1.js']
+    # last build restored artifacts from build cache
+    assert fake_run.call_count == 2
+
+
+def test_replace_file_cross_device(mocker, tmp_path):
+    (tmp_path / 'src.js').write_text('// new')
+    (tmp_path / 'dst.js').write_text('// old')
+    os_replace = os.replace
+
+    def fake_replace(src, dst):
+        if src.endswith('src.js'):
+            raise OSError(errno.EXDEV, 'Cross-device link')
+        os_replace(src, dst)
+    mocker.patch('flask_rollup.os.replace', side_effect=fake_replace)
+    (tmp_path / 'src.js').chmod(0o644)
+    replace_file(str(tmp_path / 'src.js'), str(tmp_path / 'dst.js'))
+    assert os.listdir(tmp_path) == ['dst.js']
+    assert (tmp_path / 'dst.js').read_text() == '// new'
+    assert stat.S_IMODE((tmp_path / 'dst.js').stat().st_mode) == 0o644
+
+
+def test_run_gc_grace(app, mocker, tmp_path):
+    app.static_folder = str(tmp_path)
+    app.config['ROLLUP_GC_GRACE'] = 60
+    (tmp_path / 'p1.js').write_text('// p1')
+    mocker.patch('flask_rollup.subprocess.run', side_effect=fake_rollup_run)
+    fake_timer = mocker.patch('flask_rollup.threading.Timer')
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'dist', ['p1.js']))
+    rollup.run_rollup('p1')
+    (tmp_path / 'p1.js').write_text('// p1 changed')
+    rollup.run_rollup('p1')
+    fake_timer.assert_called_once_with(60, rollup.collect_garbage)
+    assert (tmp_path / 'dist' / 'p1.5.js').is_file()
+    rollup.collect_garbage()
+    assert (tmp_path / 'dist' / 'p1.5.js').is_file()
+    rollup._garbage = {path: 0 for path in rollup._garbage}
+    rollup.collect_garbage()
+    assert not (tmp_path / 'dist' / 'p1.5.js').exists()
+    assert (tmp_path / 'dist' / 'p1.13.js').is_file()
+
+
+def test_run_process_lock(app, mocker, tmp_path):
+    app.static_folder = str(tmp_path)
+    app.config['ROLLUP_PROCESS_LOCK'] = True
+    (tmp_path / 'p1.js').write_text('// p1')
+    fake_run = mocker.patch(
+        'flask_rollup.subprocess.run', side_effect=fake_rollup_run
+    )
+    other_app = Flask(
+        'other', static_folder=str(tmp_path), instance_path=app.instance_path
+    )
+    other = Rollup(other_app)
+    other.register(Bundle('p1', 'dist', ['p1.js']))
+
+    def other_process_builds(fd, operation):
+        if operation == fcntl.LOCK_EX and fake_run.call_count == 0:
+            other.run_rollup('p1')
+    fake_flock = mocker.patch(
+        'flask_rollup.fcntl.flock', side_effect=other_process_builds
+    )
+    rollup = Rollup(app)
+    b = Bundle('p1', 'dist', ['p1.js'])
+    rollup.register(b)
+    assert rollup.run_rollup('p1') is False
+    assert fake_run.call_count == 1
+    assert b.output.static_path == 'dist/p1.5.js'
+    lock_files = glob.glob(
+        os.path.join(app.instance_path, 'flask-rollup', 'dist-*', 'bundle-p1.lock')
+    )
+    assert len(lock_files) == 1
+    assert os.listdir(tmp_path / 'dist') == ['p1.5.js']
+    # other process saves state under state file lock while lock is held
+    assert [c[0][1] for c in fake_flock.call_args_list] == [
+        fcntl.LOCK_EX, fcntl.LOCK_EX, fcntl.LOCK_UN, fcntl.LOCK_UN,
+    ]
+
+
+def test_run_batch_process_lock(app, mocker, tmp_path):
+    app.static_folder = str(tmp_path)
+    app.config['ROLLUP_PROCESS_LOCK'] = True
+    (tmp_path / 'p1.js').write_text('// p1')
+    (tmp_path / 'p2.js').write_text('// p2')
+    fake_run = mocker.patch(
+        'flask_rollup.subprocess.run', side_effect=fake_rollup_run
+    )
+    other_app = Flask(
+        'other', static_folder=str(tmp_path), instance_path=app.instance_path
+    )
+    other = Rollup(other_app)
+    for name in ['p1', 'p2']:
+        other.register(Bundle(name, 'dist', [f'{name}.js']))
+
+    def other_process_builds(fd, operation):
+        if operation == fcntl.LOCK_EX and fake_run.call_count == 0:
+            other.run_batch()
+    fake_flock = mocker.patch(
+        'flask_rollup.fcntl.flock', side_effect=other_process_builds
+    )
+    rollup = Rollup(app)
+    for name in ['p1', 'p2']:
+        rollup.register(Bundle(name, 'dist', [f'{name}.js']))
+    results = rollup.run_batch(force=False)
+    assert [(r.success, r.built) for r in results] == [(True, False), (True, False)]
+    assert fake_run.call_count == 1
+    assert rollup.bundles['p1'].output.static_path == 'dist/p1.5.js'
+    lock_files = glob.glob(
+        os.path.join(app.instance_path, 'flask-rollup', 'dist-*', 'group.lock')
+    )
+    assert len(lock_files) == 1
+    # other process saves state of both bundles under state file lock while
+    # group lock is held
+    assert [c[0][1] for c in fake_flock.call_args_list] == [
+        fcntl.LOCK_EX, fcntl.LOCK_EX, fcntl.LOCK_UN, fcntl.LOCK_EX, fcntl.LOCK_UN,
+        fcntl.LOCK_UN,
+    ]
+
+
+def test_run_build_cache(app, mocker, tmp_path):
+    static_dir = tmp_path / 'static'
+    static_dir.mkdir()
+    (static_dir / 'p1.js').write_text('// p1')
+    fake_run = mocker.patch(
+        'flask_rollup.subprocess.run', side_effect=fake_rollup_run
+    )
+    mocker.patch.object(Rollup, 'rollup_version', return_value='2.0.0')
+
+    def make_rollup(rollup_path='rollup'):
+        other_app = Flask(
+            'other', static_folder=str(static_dir),
+            instance_path=app.instance_path,
+        )
+        other_app.config['ROLLUP_PATH'] = rollup_path
+        other_app.config['ROLLUP_BUILD_CACHE'] = str(tmp_path / 'cache')
+        other_app.config['ROLLUP_STATE_CACHE'] = False
+        rollup = Rollup(other_app)
+        rollup.register(Bundle('p1', 'dist', ['p1.js']))
+        return rollup
+    make_rollup().run_rollup('p1', force=True)
+    assert fake_run.call_count == 1
+    for path in (static_dir / 'dist').iterdir():
+        path.unlink()
+    rollup = make_rollup('node_modules/.bin/rollup')
+    assert rollup.run_rollup('p1', force=True) is False
+    assert fake_run.call_count == 1
+    output = rollup.bundles['p1'].output
+    assert output.static_path == 'dist/p1.5.js'
+    assert os.path.isfile(output.file_path)
+    (static_dir / 'p1.js').write_text('// p1 changed')
+    assert make_rollup().run_rollup('p1', force=True) is True
+    assert fake_run.call_count == 2
+
+
+FAKE_ROLLUP_SCRIPT = """
+import os, sys, time
+args = sys.argv[1:]
+target_dir = args[args.index('-d') + 1]
+os.makedirs(target_dir, exist_ok=True)
+for param in args:
+    if '=' in param:
+        name, path = param.split('=', 1)
+        with open(path) as fp:
+            content = fp.read()
+        if 'fail' in content:
+            print(f'[!] Error: cannot build {name}', flush=True)
+            sys.exit(1)
+        if 'long' in content:
+            print('x' * 100000, flush=True)
+        if 'slow' in content:
+            time.sleep(30)
+        with open(os.path.join(target_dir, f'{name}.{len(content)}.js'), 'w') as fp:
+            fp.write(content)
+        print(f'created {name}', flush=True)
+"""
+
+
+@pytest.fixture()
+def fake_async_rollup(mocker, tmp_path):
+    script = tmp_path / 'fake_rollup.py'
+    script.write_text(FAKE_ROLLUP_SCRIPT)
+    create_subprocess_exec = asyncio.create_subprocess_exec
+
+    async def fake_exec(*argv, **kwargs):
+        return await create_subprocess_exec(
+            sys.executable, str(script), *argv[1:], **kwargs
+        )
+    return mocker.patch(
+        'flask_rollup.asyncio.create_subprocess_exec', side_effect=fake_exec
+    )
+
+
+def test_build_async(app, fake_async_rollup, tmp_path):
+    static_dir = tmp_path / 'static'
+    static_dir.mkdir()
+    app.static_folder = str(static_dir)
+    (static_dir / 'p1.js').write_text('// p1')
+    rollup = Rollup(app)
+    b = Bundle('p1', 'dist', ['p1.js'])
+    rollup.register(b)
+    lines = []
+    finished = []
+    with build_finished.connected_to(
+        lambda sender, bundle, stats: finished.append(bundle), rollup
+    ):
+        built = asyncio.run(
+            rollup.build('p1', on_output=lambda *args: lines.append(args))
+        )
+    assert built is True
+    assert lines == [('p1', 'created p1')]
+    assert finished == ['p1']
+    assert b.output.static_path == 'dist/p1.5.js'
+    assert asyncio.run(rollup.build('p1')) is False
+    assert fake_async_rollup.call_count == 1
+
+
+def test_build_async_failure(app, fake_async_rollup, tmp_path):
+    static_dir = tmp_path / 'static'
+    static_dir.mkdir()
+    app.static_folder = str(static_dir)
+    (static_dir / 'p1.js').write_text('// fail')
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'dist', ['p1.js']))
+    with pytest.raises(subprocess.CalledProcessError) as exc_info:
+        asyncio.run(rollup.build('p1'))
+    assert exc_info.value.returncode == 1
+    assert exc_info.value.output == '[!] Error: cannot build p1'
+    assert rollup.stats['p1']['failures'] == 1
+
+
+def test_build_async_timeout(app, fake_async_rollup, tmp_path):
+    static_dir = tmp_path / 'static'
+    static_dir.mkdir()
+    app.static_folder = str(static_dir)
+    (static_dir / 'p1.js').write_text('// slow')
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'dist', ['p1.js']))
+    start = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        asyncio.run(rollup.build('p1', timeout=0.5))
+    assert time.monotonic() - start < 10
+    assert rollup.bundles['p1'].state is None
+
+
+def test_build_async_cancel(app, fake_async_rollup, tmp_path):
+    static_dir = tmp_path / 'static'
+    static_dir.mkdir()
+    app.static_folder = str(static_dir)
+    (static_dir / 'p1.js').write_text('// slow')
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'dist', ['p1.js']))
+
+    async def cancel_build():
+        task = asyncio.ensure_future(rollup.build('p1'))
+        await asyncio.sleep(0.5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return await rollup.build('p1', timeout=0.5)
+    start = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        asyncio.run(cancel_build())
+    assert time.monotonic() - start < 10
+    assert rollup.stats['p1']['failures'] == 2
+
+
+def test_build_async_long_line(app, fake_async_rollup, tmp_path):
+    static_dir = tmp_path / 'static'
+    static_dir.mkdir()
+    app.static_folder = str(static_dir)
+    (static_dir / 'p1.js').write_text('// long')
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'dist', ['p1.js']))
+    lines = []
+    assert asyncio.run(
+        rollup.build('p1', on_output=lambda name, line: lines.append(line))
+    ) is True
+    assert ''.join(lines[:-1]) == 'x' * 100000
+    assert lines[-1] == 'created p1'
+
+
+def test_output_capture_long_line():
+    capture = OutputCapture(['p1'], 100)
+    read_fd, write_fd = os.pipe()
+
+    def write():
+        with open(write_fd, 'wb') as fp:
+            fp.write(b'x' * 200000 + b'\ncreated p1')
+    writer = threading.Thread(target=write)
+    writer.start()
+    capture.read(read_fd)
+    writer.join()
+    texts = [record.text for record in capture.records]
+    assert ''.join(texts[:-1]) == 'x' * 200000
+    assert max(len(text) for text in texts) <= 2 * OUTPUT_CHUNK_SIZE
+    assert texts[-1] == 'created p1'
+
+
+def test_build_all_async_output_error(app, fake_async_rollup, tmp_path):
+    static_dir = tmp_path / 'static'
+    static_dir.mkdir()
+    app.static_folder = str(static_dir)
+    (static_dir / 'p1.js').write_text('// long slow')
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'dist', ['p1.js']))
+
+    def on_output(name, line):
+        raise ValueError('broken callback')
+    start = time.monotonic()
+    rv = asyncio.run(rollup.build_all(on_output=on_output))
+    assert time.monotonic() - start < 10
+    assert rv[0].success is False
+    assert isinstance(rv[0].error, subprocess.SubprocessError)
+    assert isinstance(rv[0].error.__cause__, ValueError)
+
+
+def test_build_all_async(app, fake_async_rollup, tmp_path):
+    static_dir = tmp_path / 'static'
+    static_dir.mkdir()
+    app.static_folder = str(static_dir)
+    (static_dir / 'p1.js').write_text('// p1')
+    (static_dir / 'p2.js').write_text('// fail')
+    (static_dir / 'p3.js').write_text('// p3')
+    rollup = Rollup(app)
+    for name in ['p1', 'p2', 'p3']:
+        rollup.register(Bundle(name, 'dist', [f'{name}.js']))
+    rv = asyncio.run(rollup.build_all(concurrency=2))
+    assert [r.name for r in rv] == ['p1', 'p2', 'p3']
+    assert [r.success for r in rv] == [True, False, True]
+    assert isinstance(rv[1].error, subprocess.CalledProcessError)
+    rv = asyncio.run(rollup.build_all(['p1', 'p3']))
+    assert [r.built for r in rv] == [False, False]
+    assert fake_async_rollup.call_count == 3
+
+
+@pytest.mark.parametrize('line,kind,duration', [
+    ('\x1b[1m\x1b[31m[!] Error: Could not resolve\x1b[39m\x1b[22m', 'error', None),
+    ('(!) Unresolved dependencies', 'warning', None),
+    ('created dist/p1.js in 1.2s', 'created', 1.2),
+    ('created dist/p1.js, dist/p2.js in 250ms', 'created', 0.25),
+    ('created dist/p1.js in 1m 3.5s', 'created', 63.5),
+    ('src/p1.js → dist...', 'info', None),
+])
+def test_parse_output_line(line, kind, duration):
+    record = parse_output_line(line)
+    assert record.kind == kind
+    assert '\x1b' not in record.text
+    if duration is None:
+        assert record.duration is None
+    else:
+        assert record.duration == pytest.approx(duration)
+
+
+def test_run_output_capture(app, mocker, tmp_path, caplog):
+    app.static_folder = str(tmp_path)
+    app.config['ROLLUP_OUTPUT_LINES'] = 2
+    (tmp_path / 'p1.js').write_text('// p1')
+
+    def fake_rollup(argv, stdout, **kwargs):
+        os.write(stdout, 'src/p1.js → dist...\n\n'.encode('utf-8'))
+        os.write(stdout, b'(!) Plugin foo: slow\ncreated dist in 12ms\n')
+        fake_rollup_run(argv)
+    mocker.patch('flask_rollup.subprocess.run', side_effect=fake_rollup)
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'dist', ['p1.js']))
+    with caplog.at_level(logging.DEBUG, logger='flask_rollup'):
+        rollup.run_rollup('p1')
+    assert [r.kind for r in rollup.build_output['p1']] == ['warning', 'created']
+    assert rollup.build_output['p1'][1].duration == pytest.approx(0.012)
+    assert [(r.levelno, r.getMessage()) for r in caplog.records] == [
+        (logging.DEBUG, 'p1: src/p1.js → dist...'),
+        (logging.WARNING, 'p1: (!) Plugin foo: slow'),
+        (logging.INFO, 'p1: created dist in 12ms'),
+    ]
+
+
+def test_run_output_failure(app, mocker, tmp_path):
+    app.static_folder = str(tmp_path)
+    (tmp_path / 'p1.js').write_text('// p1')
+
+    def fake_rollup(argv, stdout, **kwargs):
+        os.write(stdout, b'[!] Error: Unexpected token\n')
+        raise subprocess.CalledProcessError(1, argv)
+    mocker.patch('flask_rollup.subprocess.run', side_effect=fake_rollup)
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'dist', ['p1.js']))
+    with pytest.raises(subprocess.CalledProcessError) as exc_info:
+        rollup.run_rollup('p1')
+    assert exc_info.value.output == '[!] Error: Unexpected token'
+    assert isinstance(rollup.failures['p1'], subprocess.CalledProcessError)
+
+
+def test_error_overlay(app, mocker, tmp_path):
+    def handler():
+        return '<html><body><p>page</p></body></html>'
+    mocker.patch.dict('os.environ', {'FLASK_ENV': 'development'})
+    app.static_folder = str(tmp_path)
+    (tmp_path / 'p1.js').write_text('// p1')
+    app.add_url_rule('/p1', endpoint='p1', view_func=handler)
+
+    def fake_rollup(argv, stdout, **kwargs):
+        os.write(stdout, b'[!] Error: <unexpected> token\n')
+        raise subprocess.CalledProcessError(1, argv)
+    fake_run = mocker.patch('flask_rollup.subprocess.run', side_effect=fake_rollup)
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'dist', ['p1.js']))
+    client = app.test_client()
+    rv = client.get('/p1')
+    assert rv.status_code == 500
+    html = rv.get_data(as_text=True)
+    assert 'id="flask-rollup-overlay"' in html
+    assert '[!] Error: &lt;unexpected&gt; token' in html
+    fake_run.side_effect = fake_rollup_run
+    (tmp_path / 'p1.js').write_text('// p1 fixed')
+    rv = client.get('/p1')
+    assert rv.status_code == 200
+    assert 'flask-rollup-overlay' not in rv.get_data(as_text=True)
+    fake_run.side_effect = fake_rollup
+    (tmp_path / 'p1.js').write_text('// p1 broken')
+    rv = client.get('/p1')
+    assert rv.status_code == 200
+    html = rv.get_data(as_text=True)
+    assert html.startswith('<html><body><p>page</p><div id="flask-rollup-overlay"')
+    assert html.endswith('</div></body></html>')
+
+
+def test_error_overlay_disabled(app, mocker, tmp_path):
+    mocker.patch.dict('os.environ', {'FLASK_ENV': 'development'})
+    app.config['ROLLUP_ERROR_OVERLAY'] = False
+    app.static_folder = str(tmp_path)
+    (tmp_path / 'p1.js').write_text('// p1')
+    app.add_url_rule('/p1', endpoint='p1', view_func=lambda: 'page')
+    mocker.patch(
+        'flask_rollup.subprocess.run',
+        side_effect=subprocess.CalledProcessError(1, ['rollup']),
+    )
+    rollup = Rollup(app)
+    with pytest.raises(subprocess.CalledProcessError):
+        rollup.register(Bundle('p1', 'dist', ['p1.js']))
+    rv = app.test_client().get('/p1')
+    assert rv.status_code == 500
+    assert 'flask-rollup-overlay' not in rv.get_data(as_text=True)
+
+
+def test_run_discovers_modules(app, mocker, tmp_path):
+    app.static_folder = str(tmp_path)
+    (tmp_path / 'main.js').write_text('import "./util.js";')
+    (tmp_path / 'util.js').write_text('// util')
+    rollup = Rollup(app)
+
+    def fake_rollup(argv, env, **kwargs):
+        modules = [str(tmp_path / 'main.js'), str(tmp_path / 'util.js')]
+        meta = {'entries': {'p1': modules}}
+        with open(env['FLASK_ROLLUP_META'], 'w') as fp:
+            json.dump(meta, fp)
+    mocker.patch('flask_rollup.subprocess.run', mocker.Mock(side_effect=fake_rollup))
+    b = Bundle('p1', 'dist', ['main.js'])
+    rollup.register(b)
+    assert rollup.run_rollup('p1') is True
+    assert b.modules == [str(tmp_path / 'main.js'), str(tmp_path / 'util.js')]
+    assert rollup.run_rollup('p1') is False
+    (tmp_path / 'util.js').write_text('// changed')
+    assert rollup.run_rollup('p1') is True
+
+
+def test_manifest(app, mocker, tmp_path):
+    mocker.patch.dict('os.environ', {'FLASK_ENV': 'production'})
+    app.static_folder = str(tmp_path)
+    out_dir = tmp_path / 'dist'
+    out_dir.mkdir()
+    (out_dir / 'p1.abc123.js').write_text('// bundle')
+    (out_dir / 'p1.abc123.js.map').write_text('{}')
+    rollup = Rollup(app)
+    assert rollup.manifest_path == str(tmp_path / 'rollup-manifest.json')
+    rollup.register(Bundle('p1', 'dist', ['main.js']))
+    rollup.write_manifest()
+    entry = rollup.manifest['p1']
+    assert entry['file'] == 'dist/p1.abc123.js'
+    assert entry['map'] == 'dist/p1.abc123.js.map'
+    assert entry['size'] == len('// bundle')
+    assert entry['integrity'].startswith('sha384-')
+    other_app = Flask('other', instance_path=app.instance_path)
+    other_app.static_folder = str(tmp_path)
+    other = Rollup(other_app)
+    fake_glob = mocker.patch('flask_rollup.glob.glob')
+    b = Bundle('p1', 'dist', ['main.js'])
+    other.register(b)
+    fake_glob.assert_not_called()
+    assert b.output.url == f'{other.static_url_path}/dist/p1.abc123.js'
+
+
+def test_template_tag(app, mocker, tmp_path):
+    mocker.patch.dict('os.environ', {'FLASK_ENV': 'production'})
+    app.static_folder = str(tmp_path)
+    out_dir = tmp_path / 'dist'
+    out_dir.mkdir()
+    (out_dir / 'p1.abc123.js').write_text('// bundle')
+    rollup = Rollup(app)
+    b = Bundle('p1', 'dist', ['main.js'])
+    rollup.register(b)
+    rollup.write_manifest()
+    integrity = rollup.manifest['p1']['integrity']
+    url = f'{rollup.url_path}/dist/p1.abc123.js'
+    with app.test_request_context():
+        rv = render_template_string('{{ jsbundle_tag("p1") }}')
+    assert rv == (
+        f'<script type="module" src="{url}" integrity="{integrity}" '
+        'crossorigin="anonymous"></script>'
+    )
+    ref = rollup.bundle_ref('p1')
+    assert rollup.bundle_ref('p1') is ref
+    (out_dir / 'p1.def456.js').write_text('// changed')
+    b.output = BundleOutput(
+        str(out_dir / 'p1.def456.js'), 'dist/p1.def456.js',
+        f'{rollup.url_path}/dist/p1.def456.js',
+    )
+    with app.test_request_context():
+        rv = render_template_string('{{ jsbundle("p1") }}')
+    assert rv == b.output.url
+    assert rollup.bundle_ref('p1') is not ref
+
+
+def test_template_integrity(app, mocker, tmp_path):
+    mocker.patch.dict('os.environ', {'FLASK_ENV': 'production'})
+    app.static_folder = str(tmp_path)
+    app.config['ROLLUP_SRI_ALGORITHM'] = 'sha512'
+    out_dir = tmp_path / 'dist'
+    out_dir.mkdir()
+    (out_dir / 'p1.abc123.js').write_text('// bundle')
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'dist', ['main.js']))
+    rollup.write_manifest()
+    integrity = rollup.manifest['p1']['integrity']
+    assert integrity.startswith('sha512-')
+    other_app = Flask('other', instance_path=app.instance_path)
+    other_app.static_folder = str(tmp_path)
+    other = Rollup(other_app)
+    fake_integrity = mocker.patch('flask_rollup.file_integrity')
+    other.register(Bundle('p1', 'dist', ['main.js']))
+    with other_app.test_request_context():
+        rv = render_template_string('{{ jsbundle_integrity("p1") }}')
+    assert rv == integrity
+    fake_integrity.assert_not_called()
+
+
+def test_integrity_algorithm_invalid(app):
+    app.config['ROLLUP_SRI_ALGORITHM'] = 'md5'
+    with pytest.raises(RollupBundlerError):
+        Rollup(app)
+
+
+def test_lazy_resolution(app, mocker, tmp_path):
+    mocker.patch.dict('os.environ', {'FLASK_ENV': 'production'})
+    app.static_folder = str(tmp_path)
+    app.config['ROLLUP_LAZY'] = True
+    out_dir = tmp_path / 'dist'
+    out_dir.mkdir()
+    (out_dir / 'p1.abc123.js').write_text('// bundle')
+    (out_dir / 'p2.def456.js').write_text('// bundle')
+    rollup = Rollup(app)
+    assert rollup.lazy is True
+    fake_resolve = mocker.spy(Bundle, 'resolve_paths')
+    b1 = Bundle('p1', 'dist', ['main.js'])
+    b2 = Bundle('p2', 'dist', ['other.js'])
+    rollup.register(b1)
+    rollup.register(b2)
+    fake_resolve.assert_not_called()
+    assert b1.output is None
+    with app.test_request_context():
+        rv = render_template_string('{{ jsbundle("p1") }}{{ jsbundle("p1") }}')
+    assert rv == f'{rollup.url_path}/dist/p1.abc123.js' * 2
+    assert fake_resolve.call_count == 1
+    assert b2.output is None
+    rollup.warm()
+    assert fake_resolve.call_count == 2
+    assert b2.output.url == f'{rollup.url_path}/dist/p2.def456.js'
+    rollup.warm()
+    assert fake_resolve.call_count == 2
+
+
+def test_lazy_ignored_in_development(app, mocker):
+    mocker.patch.dict('os.environ', {'FLASK_ENV': 'development'})
+    app.config['ROLLUP_LAZY'] = True
+    rollup = Rollup(app)
+    assert rollup.lazy is False
+
+
+def test_run_concurrent_builds_deduplicated(app, mocker):
+    mocker.patch('flask_rollup.file_fingerprint', mocker.Mock(return_value='fp'))
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'some/where', ['some/input/file.js']))
+    fake_run = mocker.Mock(side_effect=lambda *args, **kwargs: time.sleep(0.1))
+    mocker.patch('flask_rollup.subprocess.run', fake_run)
+    threads = [
+        threading.Thread(target=rollup.run_rollup, args=('p1',)) for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    fake_run.assert_called_once()
+
+
+def test_rebuild_policy_invalid(app):
+    app.config['ROLLUP_REBUILD_POLICY'] = 'whatever'
+    with pytest.raises(RollupBundlerError):
+        Rollup(app)
+
+
+def test_rebuild_policy_stale(app, mocker):
+    mocker.patch.dict('os.environ', {'FLASK_ENV': 'development'})
+    app.config['ROLLUP_REBUILD_POLICY'] = 'stale'
+    mocker.patch('flask_rollup.file_fingerprint', mocker.Mock(return_value='fp'))
+    mocker.patch('flask_rollup.subprocess.run')
+    rollup = Rollup(app)
+    b = Bundle('p1', 'some/where', ['some/input/file.js'])
+    rollup.register(b)
+    b.output = BundleOutput('/some/file', 'some/file', '/static/some/file')
+    b.state = 'old state'
+    started = threading.Event()
+    release = threading.Event()
+
+    def fake_build(name):
+        started.set()
+        release.wait(5)
+    mocker.patch.object(rollup, 'run_rollup', mocker.Mock(side_effect=fake_build))
+    rollup.rebuild('p1')
+    assert started.wait(5)
+    rollup.rebuild('p1')
+    release.set()
+    rollup._background['p1'].join()
+    rollup.run_rollup.assert_called_once_with('p1')
+
+
+def test_rebuild_policy_fail(app, mocker):
+    mocker.patch.dict('os.environ', {'FLASK_ENV': 'development'})
+    app.config['ROLLUP_REBUILD_POLICY'] = 'fail'
+    mocker.patch('flask_rollup.file_fingerprint', mocker.Mock(return_value='fp'))
+    mocker.patch('flask_rollup.subprocess.run')
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'some/where', ['some/input/file.js']))
+    with rollup._build_lock('p1'):
+        with pytest.raises(BuildInProgressError):
+            rollup.rebuild('p1')
+    rollup.rebuild('p1')
+
+
+def test_rebuild_check_interval(app, mocker):
+    mocker.patch.dict('os.environ', {'FLASK_ENV': 'development'})
+    app.config['ROLLUP_CHECK_INTERVAL'] = 60
+    mocker.patch('flask_rollup.file_fingerprint', mocker.Mock(return_value='fp'))
+    mocker.patch('flask_rollup.subprocess.run')
+    rollup = Rollup(app)
+    b = Bundle('p1', 'some/where', ['some/input/file.js'])
+    rollup.register(b)
+    b.output = BundleOutput('/some/file', 'some/file', '/static/some/file')
+    fake_run = mocker.patch.object(rollup, 'run_rollup')
+    rollup.rebuild('p1')
+    rollup.rebuild('p1')
+    fake_run.assert_called_once_with('p1')
+
+
+def test_rebuild_fs_events(app, mocker, tmp_path):
+    pytest.importorskip('watchdog')
+    mocker.patch.dict('os.environ', {'FLASK_ENV': 'development'})
+    mocker.patch('flask_rollup.atexit.register')
+    app.config['ROLLUP_FS_EVENTS'] = True
+    app.static_folder = str(tmp_path)
+    (tmp_path / 'main.js').write_text('// main')
+    mocker.patch('flask_rollup.subprocess.run')
+    rollup = Rollup(app)
+    try:
+        b = Bundle('p1', 'dist', ['main.js'])
+        rollup.register(b)
+        b.output = BundleOutput('/some/file', 'some/file', '/static/some/file')
+        fake_run = mocker.patch.object(rollup, 'run_rollup')
+        rollup.rebuild('p1')
+        rollup.rebuild('p1')
+        fake_run.assert_called_once_with('p1')
+        rollup.invalidate([str(tmp_path / 'other.js')])
+        rollup.rebuild('p1')
+        assert fake_run.call_count == 1
+        (tmp_path / 'main.js').write_text('// changed')
+        for _ in range(50):
+            if 'p1' in rollup._dirty:
+                break
+            time.sleep(0.1)
+        rollup.rebuild('p1')
+        assert fake_run.call_count == 2
+    finally:
+        rollup.observer.stop()
+
+
+def test_fs_events_filter(app, mocker, tmp_path):
+    app.static_folder = str(tmp_path)
+    lib_dir = tmp_path / 'node_modules' / 'lib'
+    lib_dir.mkdir(parents=True)
+    (tmp_path / 'main.js').write_text('// main')
+    rollup = Rollup(app)
+    rollup.observer = mocker.Mock()
+    b = Bundle('p1', 'dist', ['main.js'])
+    b.resolve_paths(str(tmp_path))
+    b.modules = [str(lib_dir / 'index.js')]
+    rollup.bundles['p1'] = b
+    rollup._watch_inputs(b)
+    watched = [c[0][1] for c in rollup.observer.schedule.call_args_list]
+    assert watched == [str(tmp_path)]
+    rollup.watch_node_modules = True
+    rollup._watch_inputs(b)
+    watched = [c[0][1] for c in rollup.observer.schedule.call_args_list]
+    assert watched == [str(tmp_path), str(lib_dir)]
+    handler = InputsEventHandler(rollup)
+    path = str(tmp_path / 'main.js')
+    for event_type in ['opened', 'closed', 'closed_no_write']:
+        handler.dispatch(mocker.Mock(event_type=event_type, src_path=path))
+    assert rollup._dirty == set()
+    handler.dispatch(mocker.Mock(event_type='modified', src_path=path))
+    assert rollup._dirty == {'p1'}
+
+
+def test_preloads(app, mocker):
+    def handler():
+        return render_template_string(
+            '{% for url in jsbundle_preloads(request.endpoint) %}'
+            '<link rel="modulepreload" href="{{ url }}">'
+            '{% endfor %}'
+        )
+    app.config['SERVER_NAME'] = '127.0.0.1'
+    app.config['ROLLUP_PRELOAD_HEADERS'] = True
+    rollup = Rollup(app)
+    b = Bundle('p1', 'some/where', ['some/input/file.js'])
+    rollup.register(b)
+    b.output = BundleOutput('/some/file', 'some/file', '/static/some/file')
+    b.imports = [os.path.join(b.target_dir, 'shared-1.js')]
+    app.add_url_rule('/something', endpoint='p1', view_func=handler)
+    with app.test_client() as client:
+        with app.app_context():
+            url = url_for('p1')
+        rv = client.get(url)
+        assert b'href="/static/some/where/shared-1.js"' in rv.data
+        assert rv.headers.getlist('Link') == [
+            '</static/some/file>; rel=modulepreload',
+            '</static/some/where/shared-1.js>; rel=modulepreload',
+        ]
+
+
+def test_shared_chunks_watch_invalid(app, mocker):
+    mocker.patch.dict('os.environ', {'FLASK_ENV': 'development'})
+    app.config['ROLLUP_SHARED_CHUNKS'] = True
+    app.config['ROLLUP_WATCH'] = True
+    with pytest.raises(RollupBundlerError, match='watch mode'):
+        Rollup(app)
+
+
+def test_shared_chunks_build(app, mocker, tmp_path):
+    app.static_folder = str(tmp_path)
+    app.config['ROLLUP_SHARED_CHUNKS'] = True
+    out_dir = tmp_path / 'dist'
+    out_dir.mkdir()
+    for name in ['p1.js', 'p2.js']:
+        (tmp_path / name).write_text(f'// {name}')
+    chunk_names = iter(['shared-1.js', 'shared-2.js'])
+
+    def fake_rollup(argv, env, **kwargs):
+        chunk = next(chunk_names)
+        for name in ['p1.abc.js', 'p2.abc.js', chunk, f'{chunk}.map']:
+            (out_dir / name).write_text('//')
+        meta = {'chunks': {
+            'p1.abc.js': {'name': 'p1', 'isEntry': True, 'imports': [chunk]},
+            'p2.abc.js': {'name': 'p2', 'isEntry': True, 'imports': [chunk]},
+            chunk: {'name': 'shared', 'isEntry': False, 'imports': []},
+        }}
+        with open(env['FLASK_ROLLUP_META'], 'w') as fp:
+            json.dump(meta, fp)
+    fake_run = mocker.patch(
+        'flask_rollup.subprocess.run', mocker.Mock(side_effect=fake_rollup)
+    )
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'dist', ['p1.js']))
+    rollup.register(Bundle('p2', 'dist', ['p2.js']))
+    assert rollup.run_rollup('p1') is True
+    fake_run.assert_called_once()
+    argv = fake_run.call_args[0][0]
+    assert f'p1={tmp_path / "p1.js"}' in argv
+    assert f'p2={tmp_path / "p2.js"}' in argv
+    assert rollup.run_rollup('p2') is False
+    assert rollup.bundles['p2'].chunks == [str(out_dir / 'shared-1.js')]
+    (tmp_path / 'p2.js').write_text('// changed')
+    assert rollup.run_rollup('p2') is True
+    assert not (out_dir / 'shared-1.js').exists()
+    assert not (out_dir / 'shared-1.js.map').exists()
+    assert (out_dir / 'shared-2.js').exists()
+    with app.test_request_context():
+        rv = render_template_string('{{ jsbundle_chunks("p1")|join(",") }}')
+    assert rv == f'{rollup.url_path}/dist/shared-2.js'
+
+
+def test_shared_chunks_compressed(app, mocker, tmp_path):
+    app.static_folder = str(tmp_path)
+    app.config['ROLLUP_SHARED_CHUNKS'] = True
+    app.config['ROLLUP_COMPRESS'] = ['gzip']
+    out_dir = tmp_path / 'dist'
+    out_dir.mkdir()
+    for name in ['p1.js', 'p2.js']:
+        (tmp_path / name).write_text(f'// {name}')
+    chunk_names = iter(['shared-1.js', 'shared-2.js'])
+
+    def fake_rollup(argv, env, **kwargs):
+        chunk = next(chunk_names)
+        for name in ['p1.abc.js', 'p2.abc.js', chunk, f'{chunk}.map']:
+            (out_dir / name).write_text('//')
+        meta = {'chunks': {
+            'p1.abc.js': {'name': 'p1', 'isEntry': True, 'imports': [chunk]},
+            'p2.abc.js': {'name': 'p2', 'isEntry': True, 'imports': [chunk]},
+            chunk: {'name': 'shared', 'isEntry': False, 'imports': []},
+        }}
+        with open(env['FLASK_ROLLUP_META'], 'w') as fp:
+            json.dump(meta, fp)
+    mocker.patch('flask_rollup.subprocess.run', side_effect=fake_rollup)
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'dist', ['p1.js']))
+    rollup.register(Bundle('p2', 'dist', ['p2.js']))
+    rollup.run_rollup('p1')
+    assert (out_dir / 'shared-1.js.gz').is_file()
+    assert (out_dir / 'shared-1.js.map.gz').is_file()
+    (tmp_path / 'p2.js').write_text('// changed')
+    rollup.run_rollup('p2')
+    assert sorted(name for name in os.listdir(out_dir) if 'shared' in name) == [
+        'shared-2.js', 'shared-2.js.gz', 'shared-2.js.map', 'shared-2.js.map.gz',
+    ]
+
+
+def test_build_signals(app, mocker):
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'some/where', ['some/input/p1.js']))
+    mocker.patch('flask_rollup.file_fingerprint', mocker.Mock(return_value='fp'))
+    fake_run = mocker.patch('flask_rollup.subprocess.run')
+    events = []
+
+    def receiver(name):
+        def func(sender, **kwargs):
+            events.append((name, sender, kwargs))
+        return func
+    receivers = {
+        name: receiver(name) for name in ['started', 'finished', 'skipped', 'failed']
+    }
+    build_started.connect(receivers['started'])
+    build_finished.connect(receivers['finished'])
+    build_skipped.connect(receivers['skipped'])
+    build_failed.connect(receivers['failed'])
+    try:
+        rollup.run_rollup('p1')
+        rollup.run_rollup('p1')
+        fake_run.side_effect = subprocess.CalledProcessError(1, ['rollup'])
+        with pytest.raises(subprocess.CalledProcessError):
+            rollup.run_rollup('p1', force=True)
+    finally:
+        build_started.disconnect(receivers['started'])
+        build_finished.disconnect(receivers['finished'])
+        build_skipped.disconnect(receivers['skipped'])
+        build_failed.disconnect(receivers['failed'])
+    assert [e[0] for e in events] == [
+        'started', 'finished', 'skipped', 'started', 'failed'
+    ]
+    assert all(e[1] is rollup and e[2]['bundle'] == 'p1' for e in events)
+    stats = events[1][2]['stats']
+    assert stats.inputs == 1
+    assert stats.duration >= 0
+    assert events[2][2]['reason'] == 'unchanged'
+    assert isinstance(events[4][2]['error'], subprocess.CalledProcessError)
+    entry = rollup.stats['p1']
+    assert (entry['builds'], entry['skips'], entry['failures']) == (1, 1, 1)
+
+
+def test_stats_endpoint(app, mocker):
+    app.config['ROLLUP_STATS_URL_PATH'] = '/_rollup/stats'
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'some/where', ['some/input/p1.js']))
+    mocker.patch('flask_rollup.file_fingerprint', mocker.Mock(return_value='fp'))
+    mocker.patch('flask_rollup.subprocess.run')
+    rollup.run_rollup('p1')
+    with app.test_client() as client:
+        rv = client.get('/_rollup/stats')
+        assert rv.json['p1']['builds'] == 1
+        assert rv.json['p1']['inputs'] == 1
+        rv = client.get('/_rollup/stats?format=prometheus')
+        assert rv.mimetype == 'text/plain'
+        text = rv.get_data(as_text=True)
+        assert '# TYPE flask_rollup_builds_total counter' in text
+        assert 'flask_rollup_builds_total{bundle="p1"} 1' in text
@@ -0,0 +1,79 @@
+import gzip
+
+import pytest
+
+from flask_rollup import Bundle, Rollup
+
+
+@pytest.fixture()
+def bundle_app(app, tmp_path):
+    app.static_folder = str(tmp_path)
+    app.config['ROLLUP_SERVE_URL_PATH'] = '/bundles'
+    out_dir = tmp_path / 'dist'
+    out_dir.mkdir()
+    content = b'// bundle ' * 100
+    (out_dir / 'p1.abc123.js').write_bytes(content)
+    (out_dir / 'p1.abc123.js.gz').write_bytes(gzip.compress(content))
+    (out_dir / 'chunk-def456.js').write_bytes(b'// chunk')
+    (out_dir / '.flask-rollup-state.json').write_text('{}')
+    (tmp_path / 'secret.txt').write_text('secret')
+    rollup = Rollup(app)
+    rollup.register(Bundle('p1', 'dist', ['main.js']))
+    return app
+
+
+def test_bundle_url(bundle_app):
+    rollup = bundle_app.extensions['rollup']
+    assert rollup.bundles['p1'].output.url == '/bundles/dist/p1.abc123.js'
+
+
+def test_serve_plain(bundle_app):
+    with bundle_app.test_client() as client:
+        rv = client.get('/bundles/dist/p1.abc123.js')
+        assert rv.status_code == 200
+        assert rv.data == b'// bundle ' * 100
+        assert 'immutable' in rv.headers['Cache-Control']
+        assert 'max-age=31536000' in rv.headers['Cache-Control']
+        assert rv.headers.get('Content-Encoding') is None
+        assert 'javascript' in rv.mimetype
+        etag, weak = rv.get_etag()
+        assert not weak
+        rv = client.get('/bundles/dist/p1.abc123.js', headers={'If-None-Match': etag})
+        assert rv.status_code == 304
+
+
+def test_serve_compressed(bundle_app):
+    with bundle_app.test_client() as client:
+        rv = client.get(
+            '/bundles/dist/p1.abc123.js', headers={'Accept-Encoding': 'gzip, br'}
+        )
+        assert rv.status_code == 200
+        assert rv.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in rv.headers['Vary']
+        assert gzip.decompress(rv.data) == b'// bundle ' * 100
+        rv = client.get(
+            '/bundles/dist/chunk-def456.js', headers={'Accept-Encoding': 'gzip'}
+        )
+        assert rv.headers.get('Content-Encoding') is None
+
+
+@pytest.mark.parametrize('path', [
+    '/bundles/secret.txt', '/bundles/dist/../secret.txt',
+    '/bundles/dist/.flask-rollup-state.json', '/bundles/dist/missing.js',
+    '/bundles/dist/p1.abc123.js.gz',
+], ids=['outside', 'traversal', 'dotfile', 'missing', 'compressed'])
+def test_serve_not_found(bundle_app, path):
+    with bundle_app.test_client() as client:
+        rv = client.get(path)
+        assert rv.status_code == 404
+
+
+def test_serve_x_accel_redirect(bundle_app):
+    rollup = bundle_app.extensions['rollup']
+    rollup.x_accel_redirect = '/internal/'
+    with bundle_app.test_client() as client:
+        rv = client.get(
+            '/bundles/dist/p1.abc123.js', headers={'Accept-Encoding': 'gzip'}
+        )
+        assert rv.headers['X-Accel-Redirect'] == '/internal/dist/p1.abc123.js.gz'
+        assert rv.data == b''
@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+
+from flask_rollup import Bundle, Rollup, RollupWatcher
+
+FAKE_ROLLUP = """
+import sys, time
+print('rollup v2.0.0', file=sys.stderr, flush=True)
+print('bundles a.js -> dist...', file=sys.stderr, flush=True)
+time.sleep(0.05)
+print('{result}', file=sys.stderr, flush=True)
+time.sleep(10)
+"""
+
+
+def fake_watcher(result):
+    argv = [sys.executable, '-c', FAKE_ROLLUP.format(result=result)]
+    return RollupWatcher(argv, os.environ)
+
+
+def test_watcher_build_success():
+    since = time.time_ns()
+    watcher = fake_watcher('created dist in 50ms')
+    watcher.start()
+    try:
+        assert watcher.wait(since, timeout=5) is True
+        assert watcher.builds == 1
+        assert watcher.running
+    finally:
+        watcher.stop()
+    assert not watcher.running
+
+
+def test_watcher_build_failure():
+    since = time.time_ns()
+    watcher = fake_watcher('[!] Error: Unexpected token')
+    watcher.start()
+    try:
+        assert watcher.wait(since, timeout=5) is False
+        assert watcher.build_failed
+    finally:
+        watcher.stop()
+
+
+def test_watcher_stale_build():
+    watcher = fake_watcher('created dist in 50ms')
+    watcher.start()
+    try:
+        assert watcher.wait(time.time_ns() + 10 ** 12, timeout=0.5) is False
+    finally:
+        watcher.stop()
+
+
+def test_watch_mode_run(app, mocker):
+    mocker.patch.dict('os.environ', {'FLASK_ENV': 'development'})
+    app.config['ROLLUP_WATCH'] = True
+    mocker.patch('flask_rollup.atexit.register')
+    rollup = Rollup(app)
+    mocker.patch(
+        'flask_rollup.os.stat', mocker.Mock(return_value=mocker.Mock(st_mtime_ns=100))
+    )
+    mocker.patch('flask_rollup.file_fingerprint', mocker.Mock(return_value='fp'))
+    fake_watcher_cls = mocker.patch('flask_rollup.RollupWatcher')
+    fake_watcher_cls.return_value.wait.return_value = True
+    fake_run = mocker.patch('flask_rollup.subprocess.run')
+    mocker.patch('flask_rollup.glob.glob', mocker.Mock(return_value=[]))
+    b = Bundle('p1', 'some/where', ['some/input/file.js'])
+    rollup.register(b)
+    rollup.run_rollup('p1')
+    fake_run.assert_not_called()
+    fake_watcher_cls.return_value.start.assert_called_once()
+    fake_watcher_cls.return_value.wait.assert_called_once_with(100, 30)
+    assert '-w' not in fake_watcher_cls.call_args[0][0]
+    assert b.state is not None